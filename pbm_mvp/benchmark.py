@@ -0,0 +1,152 @@
+import argparse
+import json
+import sys
+import time
+import numpy as np
+from pbm import roi, normalize, layers, features, decision, quality, config, sources, synthetic
+from enroll import EnrollmentSession
+
+SLACK_MS = 0.05
+STAGES = ("find_roi", "track_roi", "normalize_roi", "normalizer", "quality", "parallax", "features", "parallax_field", "parallax_batch", "decision_update", "decide_many")
+
+class _FrameList(sources.FrameSource):
+    def __init__(self, frames):
+        self.frames = frames
+        self.index = 0
+
+    def get_frame(self):
+        if self.index >= len(self.frames):
+            return None
+        self.index += 1
+        return self.frames[self.index - 1]
+
+class _TimedEnrollment(EnrollmentSession):
+    def __init__(self, frames, workers, sequential):
+        super().__init__(_FrameList(frames), headless=True, workers=workers, sequential=sequential)
+        self.done_at = None
+
+    def _finish(self, display):
+        self.done_at = self.seq
+
+def _timed(timings, name, fn, *args):
+    t0 = time.perf_counter()
+    out = fn(*args)
+    timings[name].append(time.perf_counter() - t0)
+    return out
+
+def run_stages(frames, sequential):
+    timings = {name: [] for name in STAGES}
+    tracker = roi.RoiTracker()
+    normalizer = normalize.Normalizer()
+    engine = decision.DecisionEngine(sequential=sequential)
+    shifts = []
+    verdicts = []
+    rois = []
+    for frame in frames:
+        _timed(timings, "find_roi", roi.find_roi, frame)
+        quad = _timed(timings, "track_roi", tracker.find, frame)
+        if quad is None:
+            shifts.append((0, 0, 0, 0, 0))
+            verdicts.append(_timed(timings, "decision_update", engine.update, 0, 0, 0, 0, 0))
+            continue
+        _timed(timings, "normalize_roi", normalize.normalize_roi, frame, quad)
+        img = _timed(timings, "normalizer", normalizer.normalize, frame, quad)
+        _timed(timings, "quality", quality.check, img)
+        shift = _timed(timings, "parallax", layers.calculate_parallax_shift, img)
+        _timed(timings, "features", features.extract_features, img)
+        _timed(timings, "parallax_field", layers.calculate_parallax_field, img)
+        rois.append(img.copy())
+        shifts.append(shift)
+        verdicts.append(_timed(timings, "decision_update", engine.update, *shift))
+    _timed(timings, "decide_many", decision.DecisionEngine(sequential=sequential).decide_many, shifts)
+    timings["decide_many"][-1] /= max(len(shifts), 1)
+    if rois:
+        _timed(timings, "parallax_batch", layers.calculate_parallax_shifts, np.stack(rois))
+        timings["parallax_batch"][-1] /= len(rois)
+    return timings, verdicts
+
+def run_session(frames, workers, sequential):
+    session = _TimedEnrollment(frames, workers, sequential)
+    t0 = time.perf_counter()
+    session.run()
+    elapsed = time.perf_counter() - t0
+    return {
+        "fps": session.seq / elapsed if elapsed > 0 else 0.0,
+        "frames_to_enroll": session.done_at,
+        "seconds_to_enroll": elapsed if session.done_at is not None else None,
+    }
+
+def _first(verdicts, value):
+    return next((i for i, v in enumerate(verdicts) if v == value), None)
+
+def run(frames, seed, workers, sequential):
+    live = list(synthetic.sequence(frames, seed=seed))
+    attack = list(synthetic.sequence(frames, attack=True, seed=seed))
+    timings, live_verdicts = run_stages(live, sequential)
+    _, attack_verdicts = run_stages(attack, sequential)
+    return {
+        "frames": frames,
+        "seed": seed,
+        "sequential": sequential,
+        "stages": {name: 1000.0 * float(np.median(t)) for name, t in timings.items() if t},
+        "live_frames_to_verdict": _first(live_verdicts, decision.VALID_3D),
+        "live_valid_frames": live_verdicts.count(decision.VALID_3D),
+        "attack_valid_frames": attack_verdicts.count(decision.VALID_3D),
+        "attack_frames_to_reject": _first(attack_verdicts, decision.INVALID_2D),
+        "session": run_session(live, workers, sequential),
+    }
+
+def compare(report, baseline, tolerance):
+    errors = []
+    for name, ms in baseline["stages"].items():
+        now = report["stages"].get(name)
+        if now is not None and now > ms * (1 + tolerance) + SLACK_MS:
+            errors.append(f"{name}: {now:.2f} ms vs baseline {ms:.2f} ms")
+    fps = baseline["session"]["fps"]
+    if report["session"]["fps"] < fps * (1 - tolerance):
+        errors.append(f"session fps: {report['session']['fps']:.1f} vs baseline {fps:.1f}")
+    if any(baseline[k] != report[k] for k in ("frames", "seed", "sequential")):
+        return errors
+    base_ttv = baseline["live_frames_to_verdict"]
+    ttv = report["live_frames_to_verdict"]
+    if base_ttv is not None and (ttv is None or ttv > base_ttv):
+        errors.append(f"frames to verdict: {ttv} vs baseline {base_ttv}")
+    if report["attack_valid_frames"] > baseline["attack_valid_frames"]:
+        errors.append(f"2D attack accepted on {report['attack_valid_frames']} frames vs baseline {baseline['attack_valid_frames']}")
+    return errors
+
+def _print(report):
+    print(f"{'stage':<16}{'median ms':>10}")
+    for name, ms in report["stages"].items():
+        print(f"{name:<16}{ms:>10.2f}")
+    s = report["session"]
+    print(f"3D: first VALID_3D at frame {report['live_frames_to_verdict']}, {report['live_valid_frames']}/{report['frames']} frames valid")
+    print(f"2D attack: {report['attack_valid_frames']}/{report['frames']} frames valid, first INVALID_2D at frame {report['attack_frames_to_reject']}")
+    if s["frames_to_enroll"] is None:
+        print(f"Session: {s['fps']:.1f} fps, did not enroll")
+    else:
+        print(f"Session: {s['fps']:.1f} fps, enrolled after {s['frames_to_enroll']} frames ({s['seconds_to_enroll']:.2f} s)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=150, help="frames per synthetic sequence")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=config.PIPELINE_WORKERS, help="frame processing threads for the session run")
+    parser.add_argument("--sequential", action="store_true", default=config.DECISION_SEQUENTIAL, help="use the early-stopping liveness test")
+    parser.add_argument("--baseline", help="fail if a stage is slower than this stored report")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown against the baseline (0.25 = 25%%)")
+    parser.add_argument("--save-baseline", help="write this run's report as a new baseline")
+    args = parser.parse_args()
+    config.SHOW_DEBUG = False
+    report = run(args.frames, args.seed, args.workers, args.sequential)
+    _print(report)
+    errors = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            errors += compare(report, json.load(f), args.tolerance)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+    for e in errors:
+        print(f"REGRESSION: {e}")
+    sys.exit(1 if errors else 0)
@@ -0,0 +1,137 @@
+import argparse
+import concurrent.futures
+import itertools
+import json
+import os
+import sys
+import numpy as np
+from pbm import config, decision, pipeline, recording, roi, sources, synthetic
+from pbm.pbm_scale import compute_pbm_scale
+
+_corpus = None
+
+def record(frames, path, label=None, token=None):
+    rec = recording.SessionRecorder(path, label, token)
+    tracker = roi.RoiTracker()
+    processor = pipeline.FrameProcessor()
+    try:
+        for seq, frame in enumerate(frames):
+            rec.add(processor.process(seq, frame, tracker.find(frame)))
+    finally:
+        rec.close()
+    return rec.frames
+
+def _load(paths):
+    global _corpus
+    _corpus = [recording.Recording(p) for p in paths]
+
+def _pbm_scale(rec, keep):
+    roi_mask = (rec["roi"] > 0) & keep
+    diff = np.hypot(rec["dnx"] - rec["dfx"], rec["dny"] - rec["dfy"])[roi_mask]
+    return compute_pbm_scale(list(diff), list(rec["area"][roi_mask]))
+
+def _evaluate(setting):
+    for name, value in setting.items():
+        setattr(config, name, value)
+    engine = decision.DecisionEngine(config.DECISION_HISTORY_LEN, bool(config.DECISION_SEQUENTIAL))
+    out = {"live": 0, "live_accepted": 0, "attack": 0, "attack_accepted": 0, "frames_to_verdict": [], "seconds_to_verdict": []}
+    scales = []
+    for rec in _corpus:
+        keep = rec["gated"] == 0
+        frames = rec.parallax()[keep]
+        coherence = rec.coherence()
+        verdicts = engine.decide_many(frames, None if coherence is None else coherence[keep])
+        valid = np.flatnonzero(verdicts == decision.VALID_3D)
+        if rec.token is not None:
+            scales.append((rec.token, _pbm_scale(rec, keep)))
+        if rec.label not in ("live", "attack"):
+            continue
+        out[rec.label] += 1
+        if len(valid):
+            out[rec.label + "_accepted"] += 1
+            if rec.label == "live":
+                out["frames_to_verdict"].append(int(valid[0]))
+                out["seconds_to_verdict"].append(float(rec["time"][keep][valid[0]]))
+    genuine = impostor = genuine_ok = impostor_ok = 0
+    for (ta, sa), (tb, sb) in itertools.combinations(scales, 2):
+        if sa is None or sb is None:
+            continue
+        ok = abs(sa - sb) < config.PBM_SCALE_EPS
+        if ta == tb:
+            genuine += 1
+            genuine_ok += ok
+        else:
+            impostor += 1
+            impostor_ok += ok
+    return {
+        "setting": setting,
+        "tpr": out["live_accepted"] / out["live"] if out["live"] else None,
+        "fpr": out["attack_accepted"] / out["attack"] if out["attack"] else None,
+        "median_frames_to_verdict": float(np.median(out["frames_to_verdict"])) if out["frames_to_verdict"] else None,
+        "median_seconds_to_verdict": float(np.median(out["seconds_to_verdict"])) if out["seconds_to_verdict"] else None,
+        "scale_genuine_match": genuine_ok / genuine if genuine else None,
+        "scale_impostor_match": impostor_ok / impostor if impostor else None,
+    }
+
+def parse_grid(specs):
+    names, values = [], []
+    for spec in specs:
+        name, _, vals = spec.partition("=")
+        if not hasattr(config, name):
+            raise ValueError(f"Unknown config parameter {name}")
+        names.append(name)
+        values.append([type(getattr(config, name))(float(v)) for v in vals.split(",")])
+    return [dict(zip(names, combo)) for combo in itertools.product(*values)]
+
+def sweep(paths, settings, workers=None):
+    with concurrent.futures.ProcessPoolExecutor(workers, initializer=_load, initargs=(paths,)) as pool:
+        return list(pool.map(_evaluate, settings, chunksize=max(1, len(settings) // (4 * (workers or os.cpu_count() or 1)))))
+
+def _fmt(v):
+    return "-" if v is None else f"{v:.3f}"
+
+def _print(results):
+    for r in sorted(results, key=lambda r: (-(r["tpr"] or 0), r["fpr"] or 0, r["median_frames_to_verdict"] or 1e9)):
+        s = " ".join(f"{k}={v}" for k, v in r["setting"].items())
+        print(f"TPR {_fmt(r['tpr'])} FPR {_fmt(r['fpr'])} frames {_fmt(r['median_frames_to_verdict'])} "
+              f"s {_fmt(r['median_seconds_to_verdict'])} scale {_fmt(r['scale_genuine_match'])}/{_fmt(r['scale_impostor_match'])}  {s}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_rec = sub.add_parser("record", help="process a source end to end into a recording")
+    p_rec.add_argument("out")
+    p_rec.add_argument("--source", help="camera index, video file, image directory or .npy frame stack")
+    p_rec.add_argument("--synthetic", choices=("live", "attack"), help="record a synthetic sequence instead of --source")
+    p_rec.add_argument("--seed", type=int, default=0)
+    p_rec.add_argument("--frames", type=int, default=120, help="number of frames to record (0 = until the source ends)")
+    p_rec.add_argument("--label", choices=("live", "attack"))
+    p_rec.add_argument("--token")
+    p_sweep = sub.add_parser("sweep", help="sweep threshold grids over recordings")
+    p_sweep.add_argument("recordings", nargs="+")
+    p_sweep.add_argument("--grid", action="append", default=[], metavar="NAME=V1,V2,...", help="config parameter values to sweep")
+    p_sweep.add_argument("--workers", type=int)
+    p_sweep.add_argument("--json", help="write all results to this file")
+    args = parser.parse_args()
+    if args.cmd == "record":
+        src = None
+        if args.synthetic:
+            frames = synthetic.sequence(args.frames or 120, attack=args.synthetic == "attack", seed=args.seed)
+            label = args.label or args.synthetic
+        else:
+            src = sources.open_source(args.source if args.source is not None else config.CAMERA_INDEX)
+            frames = itertools.islice(iter(src.get_frame, None), args.frames or None)
+            label = args.label
+        try:
+            n = record(frames, args.out, label, args.token)
+        finally:
+            if src is not None:
+                src.release()
+        print(f"Recorded {n} frames to {args.out}")
+        sys.exit(0)
+    config.SHOW_DEBUG = False
+    results = sweep(args.recordings, parse_grid(args.grid) or [{}], args.workers)
+    _print(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
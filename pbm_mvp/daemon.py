@@ -0,0 +1,244 @@
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import math
+import os
+import socket
+import stat
+import threading
+import time
+from pbm import config, keys, metrics, registry, revocation, sources, synthetic
+from verify import VerificationSession
+
+IDLE = "IDLE"
+SCANNING = "SCANNING"
+
+def _number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+def warm_up(session):
+    keys.load_public_key()
+    frame = synthetic.render_frame(synthetic.render_token(), synthetic.token_quad())
+    session.qr.decode(frame)
+    session._measure(frame, session.tracker.find(frame), flush=True)
+    session.reset()
+
+class VerificationDaemon:
+    def __init__(self, session, path=config.DAEMON_SOCKET, timeout=config.DAEMON_SCAN_TIMEOUT_S):
+        self.session = session
+        self.path = path
+        self.timeout = timeout
+        self.state = IDLE
+        self.scan_id = 0
+        self.frames = 0
+        self.result = None
+        self._cancel = threading.Event()
+        self._executor = concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix="pbm-scan")
+        self._watchers = set()
+        self._done = None
+        self._loop = None
+        self._server = None
+
+    def status(self):
+        s = self.session
+        return {
+            "state": self.state, "scan": self.scan_id, "step": s.state, "decision": s.decision_val,
+            "captured": len(s.features), "required": s.REQ, "frames": self.frames, "error": s.qr_error,
+        }
+
+    def _notify(self):
+        status = self.status()
+        for q in self._watchers:
+            q.put_nowait(status)
+
+    def _scan(self):
+        s = self.session
+        s.reset()
+        self.frames = 0
+        start = time.monotonic()
+        last = None
+        outcome = "NO_FRAMES"
+        while True:
+            if self._cancel.is_set():
+                outcome = "CANCELLED"
+                break
+            if time.monotonic() - start > self.timeout:
+                outcome = "TIMEOUT"
+                break
+            if not s.step() or s.result is not None:
+                break
+            self.frames += 1
+            progress = (s.state, s.decision_val, len(s.features), s.qr_error)
+            if progress != last:
+                self._loop.call_soon_threadsafe(self._notify)
+                last = progress
+        metrics.profiler.gauge("scan_seconds", time.monotonic() - start)
+        return s.result if s.result is not None else {"result": outcome}
+
+    async def _run_scan(self):
+        try:
+            self.result = await self._loop.run_in_executor(self._executor, self._scan)
+        except Exception as e:
+            self.result = {"result": "ERROR", "error": f"{type(e).__name__}: {e}"}
+        self.state = IDLE
+        self._done.set()
+        self._notify()
+
+    def _start(self):
+        if self.state == SCANNING:
+            return {"ok": False, "error": "busy", "scan": self.scan_id}
+        self.scan_id += 1
+        self.state = SCANNING
+        self.result = None
+        self._cancel.clear()
+        self._done = asyncio.Event()
+        self._loop.create_task(self._run_scan())
+        return {"ok": True, "scan": self.scan_id}
+
+    async def _result(self, wait=True, timeout=None):
+        if self.state == SCANNING and wait:
+            try:
+                await asyncio.wait_for(self._done.wait(), timeout)
+            except asyncio.TimeoutError:
+                return {"ok": False, "error": "timeout", "scan": self.scan_id}
+        if self.result is None:
+            return {"ok": False, "error": "no result", "scan": self.scan_id}
+        return {"ok": True, "scan": self.scan_id, **self.result}
+
+    async def _progress(self, send):
+        q = asyncio.Queue()
+        self._watchers.add(q)
+        try:
+            status = self.status()
+            await send(status)
+            while status["state"] == SCANNING:
+                status = await q.get()
+                await send(status)
+        finally:
+            self._watchers.discard(q)
+        await send(await self._result(wait=False))
+
+    async def _handle(self, reader, writer):
+        async def send(msg):
+            writer.write(json.dumps(msg).encode() + b"\n")
+            await writer.drain()
+        try:
+            async for line in reader:
+                try:
+                    req = json.loads(line)
+                except ValueError:
+                    await send({"ok": False, "error": "invalid json"})
+                    continue
+                if not isinstance(req, dict):
+                    await send({"ok": False, "error": "request must be a JSON object"})
+                    continue
+                cmd = req.get("cmd")
+                if cmd == "start":
+                    await send(self._start())
+                elif cmd == "status":
+                    await send({"ok": True, **self.status()})
+                elif cmd == "progress":
+                    await self._progress(send)
+                elif cmd == "result":
+                    timeout = req.get("timeout")
+                    if timeout is not None and not _number(timeout):
+                        await send({"ok": False, "error": "timeout must be a number"})
+                    else:
+                        await send(await self._result(bool(req.get("wait", True)), timeout))
+                elif cmd == "cancel":
+                    self._cancel.set()
+                    await send({"ok": True, "scan": self.scan_id})
+                elif cmd == "shutdown":
+                    self._cancel.set()
+                    await send({"ok": True})
+                    self._server.close()
+                else:
+                    await send({"ok": False, "error": f"unknown command {cmd!r}"})
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def _claim_path(self):
+        if not os.path.lexists(self.path):
+            return
+        if not stat.S_ISSOCK(os.lstat(self.path).st_mode):
+            raise RuntimeError(f"{self.path} exists and is not a socket")
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            try:
+                sock.connect(self.path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                os.remove(self.path)
+                return
+        raise RuntimeError(f"another daemon is already listening on {self.path}")
+
+    async def serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._claim_path()
+        umask = os.umask(0o177)
+        try:
+            self._server = await asyncio.start_unix_server(self._handle, self.path)
+        finally:
+            os.umask(umask)
+        os.chmod(self.path, 0o600)
+        print(f"Verification daemon listening on {self.path}")
+        try:
+            await self._server.wait_closed()
+        finally:
+            self._server.close()
+            if self.state == SCANNING:
+                self._cancel.set()
+                await self._done.wait()
+            self._executor.shutdown(wait=True)
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def run(self):
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            s = self.session
+            if s.pipeline is not None: s.pipeline.close()
+            s.qr.release()
+            s.cam.release()
+            metrics.profiler.export()
+
+def request(cmd, path=config.DAEMON_SOCKET, **kwargs):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        sock.sendall(json.dumps({"cmd": cmd, **kwargs}).encode() + b"\n")
+        with sock.makefile("rb") as f:
+            for line in f:
+                msg = json.loads(line)
+                yield msg
+                if cmd != "progress" or "state" not in msg:
+                    return
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--socket", default=config.DAEMON_SOCKET, help="Unix socket path")
+    parser.add_argument("--send", choices=("start", "status", "progress", "result", "cancel", "shutdown"), help="send one command to a running daemon and print the replies")
+    parser.add_argument("--source", help="camera index, video file, image directory or .npy frame stack")
+    parser.add_argument("--workers", type=int, default=config.PIPELINE_WORKERS, help="frame processing threads (0 = serial)")
+    parser.add_argument("--sequential", action="store_true", default=config.DECISION_SEQUENTIAL, help="stop as soon as the liveness test and fingerprint are conclusive")
+    parser.add_argument("--timeout", type=float, default=config.DAEMON_SCAN_TIMEOUT_S, help="give up on a scan after this many seconds")
+    parser.add_argument("--registry", help="identify the token against this fingerprint registry instead of scanning a QR")
+    parser.add_argument("--revoked", help="reject passports listed in this revocation index")
+    parser.add_argument("--seen", help="count scans per passport in this index and flag frequent reuse")
+    parser.add_argument("--metrics", help="export stage timings to a .jsonl or Prometheus .prom file")
+    args = parser.parse_args()
+    if args.send:
+        for msg in request(args.send, args.socket):
+            print(json.dumps(msg))
+    else:
+        if args.metrics: metrics.enable(args.metrics)
+        src = sources.open_source(args.source) if args.source is not None else None
+        reg = registry.Registry(args.registry) if args.registry else None
+        revoked = revocation.RevocationList(args.revoked) if args.revoked else None
+        seen = revocation.SeenIndex(args.seen) if args.seen else None
+        session = VerificationSession(src, True, args.workers, args.sequential, reg, None, revoked, seen)
+        warm_up(session)
+        VerificationDaemon(session, args.socket, args.timeout).run()
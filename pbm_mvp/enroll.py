@@ -1,73 +1,304 @@
+import argparse
+import collections
 import cv2
-import json
+import numpy as np
 import os
-from cryptography.hazmat.primitives import serialization
-from pbm import camera, roi, normalize, layers, decision, features
+from pbm import recording, passport, publisher, registry, camera, roi, decision, features, config, sources, pipeline, metrics
 from pbm.pbm_scale import compute_pbm_scale
+from pbm.running import RunningStats
+ENROLLED = "ENROLLED"
+REJECTED = "REJECTED"
 class EnrollmentSession:
-    def __init__(self):
-        self.cam = camera.Camera()
-        self.engine = decision.DecisionEngine()
+    def __init__(self, source=None, headless=False, workers=config.PIPELINE_WORKERS, sequential=config.DECISION_SEQUENTIAL, publisher=None, registry=None, recorder=None):
+        self.cam = source if source is not None else camera.Camera()
+        self.headless = headless
+        self.engine = decision.DecisionEngine(sequential=sequential)
+        self.sequential = sequential
+        self.tracker = roi.RoiTracker()
+        self.processor = pipeline.FrameProcessor()
+        self.pipeline = pipeline.FramePipeline(workers) if workers > 0 else None
+        self.decision_val = decision.UNDECIDABLE
+        self.seq = 0
         self.state = "SEARCHING"
-        self.features = []
-        self.parallax = []
-        self.areas = []
+        self.features = features.FeatureStats()
+        self.parallax = RunningStats()
+        self.areas = RunningStats()
         self.REQ = 20
+        self.publisher = publisher
+        self.registry = registry
+        self.recorder = recorder
+        self.misses = 0
+        self.gated = 0
+    def _done(self):
+        if len(self.features) >= self.REQ: return True
+        return self.sequential and features.fingerprint_converged(self.features)
     def sign(self, data, hid):
-        payload = {"id": hid, "fp": data}
-        s = json.dumps(payload, sort_keys=True)
-        with open("private_key.pem", "rb") as f:
-            k = serialization.load_pem_private_key(f.read(), password=None)
-        sig = k.sign(s.encode())
-        return {"data": payload, "sig": sig.hex()}
+        return passport.encode(data, hid)
+    def _show(self, display, wait_ms=0):
+        if self.headless: return
+        with metrics.profiler.stage("render"):
+            cv2.imshow("Enrollment", display)
+        if wait_ms: cv2.waitKey(wait_ms)
+    def _apply(self, res):
+        if self.recorder is not None:
+            self.recorder.add(res)
+        if res.roi is None:
+            if self.engine.decided == decision.INVALID_2D: self.engine.reset()
+            self.decision_val = self.engine.update(0, 0, 0, 0, 0)
+            return
+        if res.gated:
+            self.gated += 1
+            return
+        dnx, dny, dfx, dfy, conf = res.parallax
+        self.decision_val = self.engine.update(dnx, dny, dfx, dfy, conf, res.coherence)
+        diff_mag = ((dnx - dfx)**2 + (dny - dfy)**2)**0.5
+        self.parallax.add(diff_mag)
+        self.areas.add(res.area)
+        if self.decision_val == "VALID_3D":
+            f = res.features()
+            if f: self.features.add(f)
+    def _measure(self, frame, roi_cnt, flush=False):
+        if self.pipeline is None:
+            self._apply(self.processor.process(self.seq, frame, roi_cnt))
+        else:
+            if frame is not None:
+                self.pipeline.submit(frame, roi_cnt)
+            for res in (self.pipeline.drain() if flush else self.pipeline.ready()):
+                if self._done(): break
+                self._apply(res)
+        self.seq += 1
     def step(self):
         try:
             frame = self.cam.get_frame()
-            if frame is None: return False
-            display = frame.copy()
-            roi_cnt = roi.find_roi(frame)
-            if roi_cnt is None:
-                self.engine.update(0, 0, 0, 0, 0)
-                cv2.putText(display, "ALIGN FRAME", (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 255), 2)
-                cv2.imshow("Enrollment", display)
-                return True
-            norm = normalize.normalize_roi(frame, roi_cnt)
-            dnx, dny, dfx, dfy, conf = layers.calculate_parallax_shift(norm)
-            decision_val = self.engine.update(dnx, dny, dfx, dfy, conf)
-            area = cv2.contourArea(roi_cnt)
-            diff_mag = ((dnx - dfx)**2 + (dny - dfy)**2)**0.5
-            self.parallax.append(diff_mag)
-            self.areas.append(area)
-            cv2.polylines(display, [roi_cnt], True, (0, 255, 0), 2)
-            cv2.putText(display, f"LIVENESS: {decision_val}", (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 0), 2)
-            cv2.putText(display, f"CAPTURED: {len(self.features)}/{self.REQ}", (50, 90), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-            if decision_val == "VALID_3D":
-                f = features.extract_features(norm)
-                if f: self.features.append(f)
-            if len(self.features) >= self.REQ:
-                print("\nProcessing enrollment data...")
-                pbm_scale = compute_pbm_scale(self.parallax, self.areas)
-                identity, hid = features.compute_fingerprint(self.features, pbm_scale)
-                qr_data = self.sign(identity, hid)
-                import qrcode
-                qr = qrcode.make(json.dumps(qr_data))
-                os.makedirs("pattern_output", exist_ok=True)
-                qr_path = "pattern_output/last_qr.png"
-                qr.save(qr_path)
-                print(f"SUCCESS! QR saved to {qr_path}")
-                cv2.putText(display, "DONE! Check Console", (50, 150), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 3)
-                cv2.imshow("Enrollment", display)
-                cv2.waitKey(2000)
+            if frame is None:
+                if self.pipeline is not None:
+                    self._measure(None, None, flush=True)
+                    if self._done(): self._finish(None)
                 return False
-            cv2.imshow("Enrollment", display)
+            metrics.profiler.tick()
+            metrics.profiler.gauge("camera_dropped", getattr(self.cam, "dropped", 0))
+            display = None if self.headless else frame.copy()
+            with metrics.profiler.stage("roi"):
+                roi_cnt = self.tracker.find(frame)
+            if self.state == "CLEAR":
+                return self._wait_clear(roi_cnt, display)
+            self._measure(frame, roi_cnt)
+            if display is not None:
+                if roi_cnt is None:
+                    cv2.putText(display, "ALIGN FRAME", (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 255), 2)
+                else:
+                    cv2.polylines(display, [roi_cnt.astype(np.int32)], True, (0, 255, 0), 2)
+                    cv2.putText(display, f"LIVENESS: {self.decision_val}", (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 0), 2)
+                    cv2.putText(display, f"CAPTURED: {len(self.features)}/{self.REQ}", (50, 90), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+            if self._done():
+                self._finish(display)
+                return self.publisher is not None
+            self._show(display)
         except KeyboardInterrupt:
             return False
         return True
+    def _save(self, feats, parallax, areas, qr_path):
+        pbm_scale = compute_pbm_scale(parallax, areas)
+        identity, hid = features.compute_fingerprint(feats, pbm_scale)
+        if self.registry is not None:
+            dup = self.registry.find_duplicate(identity)
+            if dup is not None:
+                print(f"REJECTED: fingerprint {hid} duplicates enrolled token {dup}")
+                return REJECTED, dup, None
+            self.registry.add(identity, hid)
+        if self.publisher is not None:
+            return ENROLLED, hid, self.publisher.submit(identity, hid)
+        passport.render_qr(self.sign(identity, hid), qr_path)
+        return ENROLLED, hid, qr_path
+    def _wait_clear(self, roi_cnt, display):
+        self.misses = 0 if roi_cnt is not None else self.misses + 1
+        if self.misses > config.ROI_TRACK_MAX_MISSES:
+            self.state = "SEARCHING"
+        if display is not None:
+            cv2.putText(display, "REMOVE TOKEN", (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 255), 2)
+            self._show(display)
+        return True
+    def _next_token(self):
+        if self.pipeline is not None:
+            for _ in self.pipeline.drain(): pass
+        self.engine.reset()
+        self.tracker.reset()
+        self.decision_val = decision.UNDECIDABLE
+        self.features = features.FeatureStats()
+        self.parallax = RunningStats()
+        self.areas = RunningStats()
+        self.misses = 0
+        self.state = "CLEAR"
+    def _finish(self, display):
+        if self.publisher is not None:
+            status, hid, qr_path = self._save(self.features, self.parallax, self.areas, None)
+            if status == ENROLLED and qr_path: print(f"Enrolled {hid}, QR queued to {qr_path}")
+            self._next_token()
+            return
+        print("\nProcessing enrollment data...")
+        status, _, qr_path = self._save(self.features, self.parallax, self.areas, "pattern_output/last_qr.png")
+        if status == ENROLLED: print(f"SUCCESS! QR saved to {qr_path}")
+        if display is not None and status == ENROLLED:
+            cv2.putText(display, "DONE! Check Console", (50, 150), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 3)
+        self._show(display, 2000)
     def run(self):
         while self.step():
-            if cv2.waitKey(1) & 0xFF == ord("q"):
+            if not self.headless and cv2.waitKey(1) & 0xFF == ord("q"):
                 break
+        if self.pipeline is not None:
+            self.pipeline.close()
         self.cam.release()
-        cv2.destroyAllWindows()
+        if self.recorder is not None:
+            self.recorder.close()
+        if self.publisher is not None:
+            self.publisher.close()
+        if self.registry is not None:
+            self.registry.close()
+        metrics.profiler.export()
+        if not self.headless:
+            cv2.destroyAllWindows()
+class TokenTrack:
+    def __init__(self, tid, req, sequential=config.DECISION_SEQUENTIAL):
+        self.tid = tid
+        self.engine = decision.DecisionEngine(sequential=sequential)
+        self.sequential = sequential
+        self.decision_val = decision.UNDECIDABLE
+        self.features = features.FeatureStats()
+        self.parallax = RunningStats()
+        self.areas = RunningStats()
+        self.req = req
+        self.quad = None
+        self.missing = 0
+        self.status = None
+        self.hid = None
+        self.gated = 0
+    def done(self):
+        if len(self.features) >= self.req: return True
+        return self.sequential and features.fingerprint_converged(self.features)
+    def apply(self, res):
+        if res is None or res.roi is None:
+            if self.engine.decided == decision.INVALID_2D: self.engine.reset()
+            self.decision_val = self.engine.update(0, 0, 0, 0, 0)
+            return
+        if res.gated:
+            self.gated += 1
+            return
+        dnx, dny, dfx, dfy, conf = res.parallax
+        self.decision_val = self.engine.update(dnx, dny, dfx, dfy, conf, res.coherence)
+        self.parallax.add(((dnx - dfx)**2 + (dny - dfy)**2)**0.5)
+        self.areas.add(res.area)
+        if self.decision_val == "VALID_3D":
+            f = res.features()
+            if f: self.features.add(f)
+class TrayEnrollmentSession(EnrollmentSession):
+    def __init__(self, source=None, headless=False, workers=config.PIPELINE_WORKERS, sequential=config.DECISION_SEQUENTIAL, expected=None, publisher=None, registry=None):
+        super().__init__(source, headless, 0, sequential, publisher, registry)
+        self.tracker = roi.MultiRoiTracker()
+        self.fanout = pipeline.FramePipeline(workers if workers > 0 else os.cpu_count() or 1)
+        self.tracks = {}
+        self.finished = collections.OrderedDict()
+        self.enrolled = collections.OrderedDict()
+        self.rejected = collections.OrderedDict()
+        self.n_enrolled = 0
+        self.n_rejected = 0
+        self.expected = expected
+    def _remember(self, history, key, value):
+        history[key] = value
+        if len(history) > config.TRAY_HISTORY_MAX:
+            history.popitem(last=False)
+    def _enroll(self, track):
+        track.status, track.hid, qr_path = self._save(track.features, track.parallax, track.areas, f"pattern_output/token_{track.tid}_qr.png")
+        if track.status == REJECTED:
+            self._remember(self.rejected, track.tid, track.hid)
+            self.n_rejected += 1
+            return
+        self._remember(self.enrolled, track.tid, track.hid)
+        self.n_enrolled += 1
+        print(f"Token {track.tid}: enrolled {track.hid}, QR at {qr_path}")
+    def _draw(self, display, rois):
+        for tid, quad in rois.items():
+            track = self.tracks[tid]
+            if track.status == ENROLLED:
+                color, label = (0, 255, 0), f"#{tid} DONE"
+            elif track.status == REJECTED:
+                color, label = (0, 0, 255), f"#{tid} DUPLICATE"
+            else:
+                color, label = (255, 255, 0), f"#{tid} {track.decision_val} {len(track.features)}/{track.req}"
+            x, y = quad.reshape(4, 2).min(axis=0).astype(int)
+            cv2.polylines(display, [quad.astype(np.int32)], True, color, 2)
+            cv2.putText(display, label, (int(x), int(y) - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
+        cv2.putText(display, f"TOKENS: {len(rois)} ENROLLED: {self.n_enrolled}", (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 0), 2)
+    def step(self):
+        try:
+            frame = self.cam.get_frame()
+            if frame is None:
+                return False
+            metrics.profiler.tick()
+            metrics.profiler.gauge("camera_dropped", getattr(self.cam, "dropped", 0))
+            with metrics.profiler.stage("roi"):
+                rois = self.tracker.find(frame)
+            for tid in list(self.finished):
+                self.finished[tid].missing += 1
+                if self.finished[tid].missing > self.tracker.max_misses: del self.finished[tid]
+            for tid in list(self.tracks):
+                if tid in self.tracker.tracks: continue
+                track = self.tracks.pop(tid)
+                if track.status is not None:
+                    track.missing = 0
+                    self._remember(self.finished, tid, track)
+            new = [tid for tid in rois if tid not in self.tracks]
+            gone = list(self.finished)
+            for r, c in roi.match_quads([self.finished[tid].quad for tid in gone], [rois[tid] for tid in new], self.tracker.match_ratio).items():
+                self.tracks[new[c]] = self.finished.pop(gone[r])
+            for tid in new:
+                if tid not in self.tracks: self.tracks[tid] = TokenTrack(tid, self.REQ, self.sequential)
+            for tid, quad in rois.items():
+                self.tracks[tid].quad = quad
+            pending = {tid: q for tid, q in rois.items() if self.tracks[tid].status is None}
+            results = {res.seq: res for res in self.fanout.process_many(frame, pending)}
+            for tid, track in self.tracks.items():
+                if track.status is not None: continue
+                track.apply(results.get(tid))
+                if track.done(): self._enroll(track)
+            metrics.profiler.gauge("tray_tracks", len(self.tracks))
+            metrics.profiler.gauge("tray_enrolled", self.n_enrolled)
+            metrics.profiler.gauge("tray_rejected", self.n_rejected)
+            self.seq += 1
+            if not self.headless:
+                display = frame.copy()
+                self._draw(display, rois)
+                self._show(display)
+            if self.expected is not None and self.n_enrolled >= self.expected:
+                return False
+        except KeyboardInterrupt:
+            return False
+        return True
+    def run(self):
+        super().run()
+        self.fanout.close()
 if __name__ == "__main__":
-    EnrollmentSession().run()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--source", help="camera index, video file, image directory or .npy frame stack")
+    parser.add_argument("--headless", action="store_true", help="run without a display window")
+    parser.add_argument("--workers", type=int, default=config.PIPELINE_WORKERS, help="frame processing threads (0 = serial)")
+    parser.add_argument("--sequential", action="store_true", default=config.DECISION_SEQUENTIAL, help="stop as soon as the liveness test and fingerprint are conclusive")
+    parser.add_argument("--record", metavar="DIR", help="append per-frame parallax, ROI area and features to a columnar recording")
+    parser.add_argument("--label", choices=("live", "attack"), help="ground truth stored with --record")
+    parser.add_argument("--token", help="token identifier stored with --record")
+    parser.add_argument("--metrics", help="export stage timings to a .jsonl or Prometheus .prom file")
+    parser.add_argument("--tray", action="store_true", help="enroll every token in view in parallel")
+    parser.add_argument("--service", metavar="DIR", help="keep enrolling tokens, writing QR images and index.jsonl to DIR from a process pool")
+    parser.add_argument("--registry", help="fingerprint registry file used to reject duplicate tokens")
+    parser.add_argument("--expected", type=int, help="with --tray, stop once this many tokens are enrolled")
+    args = parser.parse_args()
+    if args.tray and args.record:
+        parser.error("--record needs a single token per session and cannot be combined with --tray")
+    if args.metrics: metrics.enable(args.metrics)
+    src = sources.open_source(args.source) if args.source is not None else None
+    pub = publisher.PassportPublisher(args.service) if args.service else None
+    reg = registry.Registry(args.registry) if args.registry else None
+    rec = recording.SessionRecorder(args.record, args.label, args.token) if args.record else None
+    if args.tray:
+        TrayEnrollmentSession(src, args.headless, args.workers, args.sequential, args.expected, pub, reg).run()
+    else:
+        EnrollmentSession(src, args.headless, args.workers, args.sequential, pub, reg, rec).run()
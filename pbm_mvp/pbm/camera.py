@@ -1,24 +1,119 @@
+import threading
+import time
 import cv2
+import numpy as np
 from . import config
 
+LATEST = "latest"
+EVERY = "every"
+
 class Camera:
-    def __init__(self, camera_index=config.CAMERA_INDEX):
+    def __init__(self, camera_index=config.CAMERA_INDEX, threaded=config.CAMERA_THREADED,
+                 mode=config.CAMERA_MODE, buffer_size=config.CAMERA_BUFFER_SIZE):
+        if mode not in (LATEST, EVERY):
+            raise ValueError(f"Unknown camera mode {mode!r}")
         self.cap = cv2.VideoCapture(camera_index)
         if not self.cap.isOpened():
             raise RuntimeError(f"Could not open camera {camera_index}")
-        
+
         self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, config.FRAME_WIDTH)
         self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, config.FRAME_HEIGHT)
-        
-        ret, _ = self.cap.read()
+
+        ret, first = self.cap.read()
         if not ret:
             raise RuntimeError(f"Camera {camera_index} opened but returned no frame")
 
+        self.mode = mode
+        self.captured = 0
+        self.dropped = 0
+        self.frame_seq = -1
+        self.frame_time = None
+        self._thread = None
+        if threaded:
+            self._start(first, max(2, buffer_size))
+
+    def _start(self, first, buffer_size):
+        self._ring = np.empty((buffer_size,) + first.shape, dtype=first.dtype)
+        self._slots = [self._ring[i] for i in range(buffer_size)]
+        self._stamps = [0.0] * buffer_size
+        self._head = 0
+        self._tail = 0
+        self._cond = threading.Condition()
+        self._running = True
+        self._stopped = False
+        self._release_on_exit = False
+        self._thread = threading.Thread(target=self._capture_loop, name="pbm-camera", daemon=True)
+        self._thread.start()
+
+    def _capture_loop(self):
+        n = len(self._slots)
+        while self._running:
+            if self.mode == EVERY:
+                with self._cond:
+                    if self._tail <= self._head - n:
+                        self.dropped += self._head - n + 1 - self._tail
+                        self._tail = self._head - n + 1
+            slot = self._slots[self._head % n]
+            ret, img = self.cap.read(slot)
+            if not ret:
+                break
+            if img is not slot:
+                if img.shape != slot.shape:
+                    break
+                np.copyto(slot, img)
+            with self._cond:
+                self._stamps[self._head % n] = time.monotonic()
+                self._head += 1
+                self.captured += 1
+                self._cond.notify_all()
+        with self._cond:
+            self._running = False
+            self._stopped = True
+            self._cond.notify_all()
+            release = self._release_on_exit
+        if release:
+            self.cap.release()
+
+    def _take(self, seq):
+        n = len(self._slots)
+        self.frame_seq = seq
+        self.frame_time = self._stamps[seq % n]
+        return self._slots[seq % n].copy()
+
     def get_frame(self):
-        ret, frame = self.cap.read()
-        if not ret:
-            return None
-        return frame
+        if self._thread is None:
+            ret, frame = self.cap.read()
+            if not ret:
+                return None
+            self.captured += 1
+            self.frame_seq += 1
+            self.frame_time = time.monotonic()
+            return frame
+        with self._cond:
+            if self.mode == LATEST:
+                ready = lambda: self._head - 1 > self.frame_seq
+            else:
+                ready = lambda: self._tail < self._head
+            if not self._cond.wait_for(lambda: ready() or not self._running, config.CAMERA_READ_TIMEOUT_S):
+                return None
+            if not ready():
+                return None
+            if self.mode == LATEST:
+                seq = self._head - 1
+                self.dropped += seq - self.frame_seq - 1
+                self._tail = self._head
+                return self._take(seq)
+            seq = self._tail
+            self._tail += 1
+            return self._take(seq)
 
     def release(self):
+        if self._thread is not None:
+            with self._cond:
+                self._running = False
+            self._thread.join(timeout=config.CAMERA_READ_TIMEOUT_S)
+            with self._cond:
+                if not self._stopped:
+                    self._release_on_exit = True
+                    return
         self.cap.release()
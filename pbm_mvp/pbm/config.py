@@ -26,4 +26,72 @@ ERROR_COLOR = (0, 0, 255)
 DIFFERENTIAL_MOTION_THRESHOLD = 0.5
 DIRECTIONAL_COHERENCE_THRESHOLD = 0.4
 SIGN_CONSISTENCY_THRESHOLD = 0.5
-PARALLAX_GAIN_THRESHOLD = 0.15
\ No newline at end of file
+PARALLAX_GAIN_THRESHOLD = 0.15
+CAMERA_THREADED = True
+CAMERA_MODE = "latest"
+CAMERA_BUFFER_SIZE = 4
+CAMERA_READ_TIMEOUT_S = 1.0
+FFT_WORKERS = 1
+ROI_TRACK_PYR_LEVELS = 1
+ROI_TRACK_PAD_RATIO = 0.25
+ROI_SUBPIX_WIN = 5
+NORMALIZE_REUSE_EPS_PX = 0.25
+PIPELINE_WORKERS = 0
+PIPELINE_MAX_PENDING = 4
+PIPELINE_DROP_POLICY = "block"
+METRICS_ENABLED = False
+METRICS_WINDOW = 512
+METRICS_EXPORT_INTERVAL_S = 10.0
+LIVENESS_LOG_EVERY = 15
+QR_SCAN_THREADED = True
+QR_SCAN_INTERVAL_S = 0.1
+QR_ROI_PAD_RATIO = 0.3
+QR_PAYLOAD_CACHE = 256
+DECISION_SEQUENTIAL = False
+DECISION_SEQ_MIN_FRAMES = 8
+DECISION_SPRT_P_LIVE = 0.6
+DECISION_SPRT_P_FLAT = 0.2
+DECISION_SPRT_ALPHA = 0.01
+DECISION_SPRT_BETA = 0.05
+DECISION_SPRT_FLAT_MIN_CONF = 0.04
+FINGERPRINT_MIN_FRAMES = 5
+FINGERPRINT_SEM_TOL = 0.004
+FINGERPRINT_ANGLE_SEM_TOL = 1.0
+ROI_MULTI_MIN_AREA_RATIO = 0.005
+ROI_TRACK_MATCH_RATIO = 0.5
+ROI_TRACK_MAX_MISSES = 5
+ROI_NEST_DUP_RATIO = 0.6
+TRAY_HISTORY_MAX = 4096
+PUBLISH_WORKERS = 2
+PUBLISH_BATCH = 32
+PUBLISH_FLUSH_S = 0.5
+PASSPORT_FORMAT = "binary"
+PARALLAX_BATCH_CHUNK = 8
+PARALLAX_BATCH_MB = 48
+FIELD_TILE = 128
+FIELD_STRIDE = 96
+FIELD_ENABLED = False
+FIELD_MIN_COHERENCE = 0.5
+FIELD_COHERENCE_TOL_PX = 1.5
+QUALITY_GATE = False
+QUALITY_PYR_LEVELS = 1
+QUALITY_MIN_SHARPNESS = 100.0
+QUALITY_MAX_SATURATION = 0.25
+QUALITY_MIN_CONTRAST = 15.0
+QUALITY_DARK_LEVEL = 5
+QUALITY_BRIGHT_LEVEL = 250
+FINGERPRINT_FREQ_TOL = 0.02
+FINGERPRINT_ANGLE_TOL = 5.0
+REGISTRY_PATH = "registry.bin"
+REGISTRY_FLUSH_S = 0.5
+REVOCATION_PATH = "revoked.bin"
+SEEN_PATH = "seen.bin"
+SEEN_MAX_SCANS = 20
+INDEX_COMPACT_AT = 65536
+STATION_PIPELINE_WORKERS = 0
+STATION_PREVIEW_SHAPE = (240, 320, 3)
+STATION_PREVIEW_COLS = 4
+STATION_STOP_TIMEOUT_S = 5.0
+DAEMON_SOCKET = "/tmp/pbm-verify.sock"
+DAEMON_SCAN_TIMEOUT_S = 30.0
+FINGERPRINT_OUTLIER_Z = 4.0
@@ -1,53 +1,208 @@
+import bisect
 import numpy as np
-import collections
-from . import config
+from . import config, metrics
 VALID_3D = "VALID_3D"
 INVALID_2D = "INVALID_2D"
 UNDECIDABLE = "UNDECIDABLE"
+_VALID, _DIFF_X, _DIFF_MAG, _UNIT_X, _UNIT_Y, _GAIN, _POS, _NEG, _MAG, _MAG_SQ, _CONF = range(11)
+_NCOLS = 11
+def _frame_rows(frames):
+    frames = np.asarray(frames, dtype=np.float64).reshape(-1, 5)
+    dnx, dny, dfx, dfy, conf = frames.T
+    valid = (conf >= config.DECISION_MIN_CONF).astype(np.float64)
+    diff_x = dnx - dfx
+    diff_y = dny - dfy
+    diff_mag = np.hypot(diff_x, diff_y)
+    norm = np.where(diff_mag == 0, 1e-6, diff_mag)
+    mag_near = np.sqrt(dnx**2 + dny**2)
+    rows = np.empty((len(frames), _NCOLS))
+    rows[:, _VALID] = valid
+    rows[:, _DIFF_X] = diff_x * valid
+    rows[:, _DIFF_MAG] = diff_mag * valid
+    rows[:, _UNIT_X] = diff_x / norm * valid
+    rows[:, _UNIT_Y] = diff_y / norm * valid
+    rows[:, _GAIN] = diff_mag / (mag_near + 1e-6) * valid
+    rows[:, _POS] = (diff_x > 0) * valid
+    rows[:, _NEG] = (diff_x < 0) * valid
+    rows[:, _MAG] = mag_near
+    rows[:, _MAG_SQ] = mag_near**2
+    rows[:, _CONF] = conf
+    return rows
+def field_coherence(field):
+    tiles = np.asarray(field, dtype=np.float64).reshape(-1, 5)
+    tiles = tiles[tiles[:, 4] >= config.DECISION_MIN_CONF]
+    if len(tiles) == 0:
+        return 0.0
+    ref = np.median(tiles[:, :4], axis=0)
+    agree = np.abs(tiles[:, :4] - ref).max(axis=1) <= config.FIELD_COHERENCE_TOL_PX
+    return float(agree.mean())
+def _gate(frames, coherence):
+    frames = np.array(frames, dtype=np.float64).reshape(-1, 5)
+    if coherence is not None:
+        frames[np.asarray(coherence).reshape(-1) < config.FIELD_MIN_COHERENCE, 4] = 0.0
+    return frames
+def _sign_consistency(sums, n):
+    diff_x = sums[..., _DIFF_X]
+    pos, neg = sums[..., _POS], sums[..., _NEG]
+    return np.where(diff_x > 0, pos, np.where(diff_x < 0, neg, n - pos - neg)) / n
+def _verdict(mean_diff, mean_dir, sign_consistency, mean_gain, mag_swing):
+    return np.select(
+        [
+            mag_swing < config.DECISION_MIN_MAG_SWING,
+            mean_diff < config.DIFFERENTIAL_MOTION_THRESHOLD,
+            mean_dir < config.DIRECTIONAL_COHERENCE_THRESHOLD,
+            sign_consistency < config.SIGN_CONSISTENCY_THRESHOLD,
+            mean_gain < config.PARALLAX_GAIN_THRESHOLD,
+        ],
+        [UNDECIDABLE, INVALID_2D, INVALID_2D, INVALID_2D, INVALID_2D],
+        VALID_3D,
+    )
+def _sprt_bounds():
+    a, b = config.DECISION_SPRT_ALPHA, config.DECISION_SPRT_BETA
+    return np.log(b / (1 - a)), np.log((1 - b) / a)
+def _evidence(rows, median_mag):
+    p1, p0 = config.DECISION_SPRT_P_LIVE, config.DECISION_SPRT_P_FLAT
+    shifted = (rows[..., _DIFF_MAG] >= config.DIFFERENTIAL_MOTION_THRESHOLD) & (rows[..., _GAIN] >= config.PARALLAX_GAIN_THRESHOLD)
+    live = shifted & (np.abs(rows[..., _MAG] - median_mag) >= config.DECISION_EPS_SHIFT_PX)
+    flat = ~shifted & (rows[..., _CONF] >= config.DECISION_SPRT_FLAT_MIN_CONF)
+    llr = np.where(live, np.log(p1 / p0), np.where(flat, np.log((1 - p1) / (1 - p0)), 0.0))
+    return np.where(rows[..., _VALID] > 0, llr, 0.0)
+def _percentile_sorted(values, q):
+    h = (len(values) - 1) * q / 100.0
+    lo = int(h)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (h - lo) * (values[hi] - values[lo])
 class DecisionEngine:
-    def __init__(self):
-        self.history = collections.deque(maxlen=config.DECISION_HISTORY_LEN)
-    def update(self, dnx, dny, dfx, dfy, conf):
-        self.history.append((dnx, dny, dfx, dfy, conf))
+    def __init__(self, history_len=config.DECISION_HISTORY_LEN, sequential=config.DECISION_SEQUENTIAL):
+        self.maxlen = history_len
+        self.sequential = sequential
+        self.reset()
+    def reset(self):
+        self.llr = 0.0
+        self.decided = None
+        self._frames = np.zeros((self.maxlen, 5))
+        self._rows = np.zeros((self.maxlen, _NCOLS))
+        self._sums = np.zeros(_NCOLS)
+        self._valid_mags = []
+        self._count = 0
+        self._evictions = 0
+    def __len__(self):
+        return min(self._count, self.maxlen)
+    @property
+    def history(self):
+        n = len(self)
+        start = self._count - n
+        return self._frames[np.arange(start, self._count) % self.maxlen]
+    def update(self, dnx, dny, dfx, dfy, conf, coherence=None):
+        if coherence is not None and coherence < config.FIELD_MIN_COHERENCE:
+            conf = 0.0
+        slot = self._count % self.maxlen
+        if self._count >= self.maxlen:
+            old = self._rows[slot]
+            self._sums -= old
+            if old[_VALID]:
+                del self._valid_mags[bisect.bisect_left(self._valid_mags, old[_MAG])]
+            self._evictions += 1
+        self._frames[slot] = (dnx, dny, dfx, dfy, conf)
+        row = self._rows[slot]
+        row[:] = _frame_rows(self._frames[slot])[0]
+        self._sums += row
+        if row[_VALID]:
+            bisect.insort(self._valid_mags, row[_MAG])
+        self._count += 1
+        if self._evictions >= self.maxlen:
+            self._sums = self._rows[:len(self)].sum(axis=0)
+            self._evictions = 0
+        if self.sequential:
+            return self._decide_sequential(row)
         return self._decide()
+    def _metrics(self):
+        s = self._sums
+        n = len(self._valid_mags)
+        return (
+            s[_DIFF_MAG] / n,
+            np.hypot(s[_UNIT_X], s[_UNIT_Y]) / n,
+            float(_sign_consistency(s, n)),
+            s[_GAIN] / n,
+            _percentile_sorted(self._valid_mags, 95) - _percentile_sorted(self._valid_mags, 5),
+        )
     def _decide(self):
-        valid = [h for h in self.history if h[4] >= config.DECISION_MIN_CONF]
-        if len(valid) < config.DECISION_HISTORY_LEN // 2:
+        if len(self._valid_mags) < self.maxlen // 2:
             return UNDECIDABLE
-        dnxs = np.array([h[0] for h in valid])
-        dnys = np.array([h[1] for h in valid])
-        dfxs = np.array([h[2] for h in valid])
-        dfys = np.array([h[3] for h in valid])
-        diff_x = dnxs - dfxs
-        diff_y = dnys - dfys
-        diff_vecs = np.stack([diff_x, diff_y], axis=1)
-        diff_mags = np.linalg.norm(diff_vecs, axis=1)
-        mean_diff = np.mean(diff_mags)
-        norms = diff_mags.copy()
-        norms[norms == 0] = 1e-6
-        unit_vecs = diff_vecs / norms[:, None]
-        mean_dir = np.linalg.norm(np.mean(unit_vecs, axis=0))
-        sign_consistency = np.mean(np.sign(diff_x) == np.sign(np.mean(diff_x)))
-        mags_near = np.sqrt(dnxs**2 + dnys**2)
-        gain = diff_mags / (mags_near + 1e-6)
-        mean_gain = np.mean(gain)
-        mag_swing = np.percentile(mags_near, 95) - np.percentile(mags_near, 5)
-        if config.SHOW_DEBUG:
+        mean_diff, mean_dir, sign_consistency, mean_gain, mag_swing = self._metrics()
+        metrics.profiler.gauge("liveness_diff", mean_diff)
+        metrics.profiler.gauge("liveness_dir", mean_dir)
+        metrics.profiler.gauge("liveness_sign", sign_consistency)
+        metrics.profiler.gauge("liveness_gain", mean_gain)
+        metrics.profiler.gauge("liveness_swing", mag_swing)
+        if config.SHOW_DEBUG and self._count % config.LIVENESS_LOG_EVERY == 0:
             print(f"LIVENESS -> Diff:{mean_diff:.2f} Dir:{mean_dir:.2f} Sgn:{sign_consistency:.2f} Gain:{mean_gain:.3f} Swg:{mag_swing:.1f}")
-        if mag_swing < config.DECISION_MIN_MAG_SWING:
+        return str(_verdict(mean_diff, mean_dir, sign_consistency, mean_gain, mag_swing))
+    def _decide_sequential(self, row):
+        if self.decided is not None:
+            return self.decided
+        if len(self._valid_mags) < config.DECISION_SEQ_MIN_FRAMES:
             return UNDECIDABLE
-        if mean_diff < config.DIFFERENTIAL_MOTION_THRESHOLD:
-            return INVALID_2D
-        if mean_dir < config.DIRECTIONAL_COHERENCE_THRESHOLD:
-            return INVALID_2D
-        if sign_consistency < config.SIGN_CONSISTENCY_THRESHOLD:
-            return INVALID_2D
-        if mean_gain < config.PARALLAX_GAIN_THRESHOLD:
-            return INVALID_2D
-        return VALID_3D
+        lower, upper = _sprt_bounds()
+        self.llr = float(np.clip(self.llr + _evidence(row, _percentile_sorted(self._valid_mags, 50)), lower, upper))
+        metrics.profiler.gauge("liveness_llr", self.llr)
+        if config.SHOW_DEBUG and self._count % config.LIVENESS_LOG_EVERY == 0:
+            print(f"LIVENESS -> LLR:{self.llr:.2f} [{lower:.2f}, {upper:.2f}]")
+        if self.llr <= lower:
+            self.decided = INVALID_2D
+        elif self.llr >= upper and _verdict(*self._metrics()) == VALID_3D:
+            self.decided = VALID_3D
+        return self.decided or UNDECIDABLE
+    def _sequential_many(self, rows, n, median, gates):
+        inc = np.where(n >= config.DECISION_SEQ_MIN_FRAMES, _evidence(rows, median), 0.0)
+        lower, upper = _sprt_bounds()
+        verdicts = []
+        acc, decided = 0.0, None
+        for x, ok in zip(inc, gates == VALID_3D):
+            if decided is None:
+                acc = min(max(acc + x, lower), upper)
+                if acc <= lower:
+                    decided = INVALID_2D
+                elif acc >= upper and ok:
+                    decided = VALID_3D
+            verdicts.append(decided or UNDECIDABLE)
+        return np.array(verdicts)
+    def decide_many(self, frames, coherence=None):
+        rows = _frame_rows(_gate(frames, coherence))
+        t = len(rows)
+        csum = np.zeros((t + 1, _NCOLS))
+        np.cumsum(rows, axis=0, out=csum[1:])
+        end = np.arange(1, t + 1)
+        sums = csum[end] - csum[np.maximum(end - self.maxlen, 0)]
+        n = sums[:, _VALID]
+        safe_n = np.maximum(n, 1)
+        mags = np.where(rows[:, _VALID] > 0, rows[:, _MAG], np.inf)
+        mags = np.concatenate([np.full(self.maxlen - 1, np.inf), mags])
+        windows = np.sort(np.lib.stride_tricks.sliding_window_view(mags, self.maxlen), axis=1)
+        def pct(q):
+            h = (safe_n - 1) * q / 100.0
+            lo = h.astype(np.int64)
+            hi = np.minimum(lo + 1, safe_n.astype(np.int64) - 1)
+            v_lo = np.take_along_axis(windows, lo[:, None], axis=1)[:, 0]
+            v_hi = np.take_along_axis(windows, hi[:, None], axis=1)[:, 0]
+            return v_lo + (h - lo) * (v_hi - v_lo)
+        with np.errstate(invalid="ignore"):
+            verdicts = _verdict(
+                sums[:, _DIFF_MAG] / safe_n,
+                np.hypot(sums[:, _UNIT_X], sums[:, _UNIT_Y]) / safe_n,
+                _sign_consistency(sums, safe_n),
+                sums[:, _GAIN] / safe_n,
+                pct(95) - pct(5),
+            )
+            median = pct(50)
+        if self.sequential:
+            return self._sequential_many(rows, n, median, verdicts)
+        return np.where(n < self.maxlen // 2, UNDECIDABLE, verdicts)
     def get_metrics(self):
-        if len(self.history) == 0:
+        n = len(self)
+        if n == 0:
             return 0.0, 0.0, 0.0
-        m = np.array(list(self.history))
-        mags = np.sqrt(m[:, 0]**2 + m[:, 1]**2)
-        return np.mean(mags), np.std(mags), np.mean(m[:, 4])
+        s = self._sums
+        mean = s[_MAG] / n
+        std = np.sqrt(max(s[_MAG_SQ] / n - mean**2, 0.0))
+        return mean, std, s[_CONF] / n
@@ -1,31 +1,49 @@
 import numpy as np
 import hashlib
 import json
-import cv2
-def _get_peak_locs(mag, ccol, crow, limit=500, min_dist=20, max_dist=200):
-    flat_indices = np.argsort(mag.ravel())[::-1]
+import functools
+from . import config, spectrum
+from .running import RunningStats
+KEYS = ("f1", "a1", "f2", "a2", "rel_angle")
+ANGLE_KEYS = ("a1", "a2", "rel_angle")
+_ANGLE = np.array([k in ANGLE_KEYS for k in KEYS])
+@functools.lru_cache(maxsize=8)
+def _annulus(shape, ccol, crow, min_dist, max_dist):
+    y, x = np.ogrid[:shape[0], :shape[1]]
+    r2 = (x - ccol) ** 2 + (y - crow) ** 2
+    idx = np.flatnonzero((r2 >= min_dist ** 2) & (r2 <= max_dist ** 2))
+    idx.flags.writeable = False
+    return idx
+def _refine(mag, x, y):
+    def offset(l, c, r):
+        den = l - 2 * c + r
+        return 0.0 if den >= 0 else float(np.clip(0.5 * (l - r) / den, -0.5, 0.5))
+    rows, cols = mag.shape
+    dx = offset(mag[y, x - 1], mag[y, x], mag[y, x + 1]) if 0 < x < cols - 1 else 0.0
+    dy = offset(mag[y - 1, x], mag[y, x], mag[y + 1, x]) if 0 < y < rows - 1 else 0.0
+    return x + dx, y + dy
+def _get_peak_locs(mag, ccol, crow, limit=500, min_dist=20, max_dist=200, count=2, sep=15):
+    annulus = _annulus(mag.shape, ccol, crow, min_dist, max_dist)
+    vals = mag.ravel()[annulus]
+    limit = min(limit, vals.size)
+    top = np.argpartition(vals, vals.size - limit)[vals.size - limit:]
+    top = top[np.argsort(vals[top])[::-1]]
+    ys, xs = np.divmod(annulus[top], mag.shape[1])
+    alive = vals[top] > 0
     peak_locs = []
-    for idx in flat_indices[:limit]:
-        y, x = np.unravel_index(idx, mag.shape)
-        dist = np.sqrt((x - ccol) ** 2 + (y - crow) ** 2)
-        if not (min_dist <= dist <= max_dist):
-            continue
-        if all(np.sqrt((x - px) ** 2 + (y - py) ** 2) >= 15 for px, py in peak_locs):
-            peak_locs.append((x, y))
-            if len(peak_locs) >= 2:
-                break
+    while len(peak_locs) < count and alive.any():
+        i = np.argmax(alive)
+        x, y = xs[i], ys[i]
+        peak_locs.append(_refine(mag, x, y))
+        alive &= (xs - x) ** 2 + (ys - y) ** 2 >= sep ** 2
     return peak_locs
 def extract_features(norm_img):
-    if norm_img is None:
+    a = spectrum.analyze(norm_img)
+    if a is None:
         return None
-    img_gray = cv2.cvtColor(norm_img, cv2.COLOR_BGR2GRAY) if len(norm_img.shape) == 3 else norm_img
-    f = np.fft.fft2(img_gray)
-    fshift = np.fft.fftshift(f)
-    mag = np.abs(fshift)
-    rows, cols = img_gray.shape
+    rows, cols = a.shape
     crow, ccol = rows // 2, cols // 2
-    cv2.circle(mag, (ccol, crow), 15, 0, -1)
-    peak_locs = _get_peak_locs(mag, ccol, crow)
+    peak_locs = _get_peak_locs(a.magnitude, ccol, crow)
     if len(peak_locs) < 2:
         return None
     p1, p2 = peak_locs
@@ -40,10 +58,39 @@ def extract_features(norm_img):
         "a2": float(a2),
         "rel_angle": float(abs(a1 - a2))
     }
+class FeatureStats(RunningStats):
+    def __init__(self):
+        super().__init__(len(KEYS))
+        self.rejected = 0
+    def _outlier(self, x):
+        z = config.FINGERPRINT_OUTLIER_Z
+        if z <= 0 or self.n < config.FINGERPRINT_MIN_FRAMES:
+            return False
+        tol = np.where(_ANGLE, config.FINGERPRINT_ANGLE_TOL, config.FINGERPRINT_FREQ_TOL)
+        return bool((np.abs(x - self.mean) > np.maximum(z * self.std, tol)).any())
+    def add(self, feats, reject=True):
+        x = np.array([feats[k] for k in KEYS])
+        if reject and self._outlier(x):
+            self.rejected += 1
+            return False
+        super().add(x)
+        return True
+    def means(self):
+        return dict(zip(KEYS, self.mean.tolist()))
+def _stats(history):
+    if isinstance(history, FeatureStats):
+        return history
+    stats = FeatureStats()
+    for f in history:
+        stats.add(f, reject=False)
+    return stats
+def fingerprint_converged(history, min_frames=config.FINGERPRINT_MIN_FRAMES):
+    if len(history) < max(min_frames, 2):
+        return False
+    tol = np.where(_ANGLE, config.FINGERPRINT_ANGLE_SEM_TOL, config.FINGERPRINT_SEM_TOL)
+    return bool((_stats(history).sem < tol).all())
 def compute_fingerprint(history, pbm_scale):
-    avg = {}
-    for k in history[0].keys():
-        avg[k] = np.mean([f[k] for f in history])
+    avg = _stats(history).means()
     avg["pbm_scale"] = pbm_scale
     identity = {k: round(v, 4) for k, v in avg.items()}
     s = json.dumps(identity, sort_keys=True)
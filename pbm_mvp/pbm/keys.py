@@ -0,0 +1,21 @@
+import functools
+import hashlib
+from cryptography.hazmat.primitives import serialization
+
+PRIVATE_KEY_PATH = "private_key.pem"
+PUBLIC_KEY_PATH = "public_key.pem"
+KEY_ID_BYTES = 4
+
+@functools.lru_cache(maxsize=None)
+def load_private_key(path=PRIVATE_KEY_PATH):
+    with open(path, "rb") as f:
+        return serialization.load_pem_private_key(f.read(), password=None)
+
+@functools.lru_cache(maxsize=None)
+def load_public_key(path=PUBLIC_KEY_PATH):
+    with open(path, "rb") as f:
+        return serialization.load_pem_public_key(f.read())
+
+def key_id(public_key):
+    raw = public_key.public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+    return hashlib.sha256(raw).digest()[:KEY_ID_BYTES]
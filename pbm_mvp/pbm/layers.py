@@ -1,35 +1,116 @@
 import cv2
 import numpy as np
-from . import config
-def calculate_parallax_shift(img):
-    if img is None:
-        return 0, 0, 0, 0, 0
-    if len(img.shape) == 3:
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    rows, cols = img.shape
-    hann_row = np.hanning(rows)
-    hann_col = np.hanning(cols)
-    window = hann_row[:, np.newaxis] * hann_col[np.newaxis, :]
-    img_float = img.astype(np.float32) * window
-    f = np.fft.fft2(img_float)
-    f_shift = np.fft.fftshift(f)
-    crow, ccol = rows // 2, cols // 2
-    y, x = np.ogrid[-crow:rows-crow, -ccol:cols-ccol]
-    mask_near = (x**2 + y**2 <= config.GRID_FREQ_MAX**2) & (x**2 + y**2 > config.FREQ_SPLIT_PX**2)
-    mask_far = (x**2 + y**2 <= config.FREQ_SPLIT_PX**2) & (x**2 + y**2 > config.GRID_FREQ_MIN**2)
-    def get_layer_shift(mask):
-        f_layer = f_shift * mask
-        psd = np.abs(np.fft.ifftshift(f_layer))**2
-        autocorr = np.fft.ifft2(psd)
-        autocorr = np.abs(np.fft.fftshift(autocorr))
-        cv2.circle(autocorr, (ccol, crow), config.PEAK_MASK_RADIUS, 0, -1)
-        _, max_val, _, max_loc = cv2.minMaxLoc(autocorr)
-        mean_val = np.mean(autocorr)
+import scipy.fft
+from . import config, spectrum
+class _Plan:
+    def __init__(self, rows, cols, scale=1.0):
+        self.shape = (rows, cols)
+        self.crow, self.ccol = rows // 2, cols // 2
+        fy = np.fft.fftfreq(rows, 1.0 / rows)[:, np.newaxis]
+        fx = np.arange(cols // 2 + 1)[np.newaxis, :]
+        r2 = (fx**2 + fy**2) / scale**2
+        self.masks = np.stack([
+            (r2 <= config.GRID_FREQ_MAX**2) & (r2 > config.FREQ_SPLIT_PX**2),
+            (r2 <= config.FREQ_SPLIT_PX**2) & (r2 > config.GRID_FREQ_MIN**2),
+        ]).astype(np.float32)
+        self.psd = np.empty(self.masks.shape, dtype=np.float32)
+        self.autocorr = np.empty(self.shape, dtype=np.float32)
+        peak = np.zeros(self.shape, dtype=np.uint8)
+        cv2.circle(peak, (self.ccol, self.crow), config.PEAK_MASK_RADIUS, 1, -1)
+        self.peak_idx = np.flatnonzero(np.fft.ifftshift(peak))
+def _gray_stack(stack):
+    stack = np.asarray(stack)
+    if stack.ndim == 4:
+        stack = np.stack([cv2.cvtColor(f, cv2.COLOR_BGR2GRAY) for f in stack])
+    return stack.astype(np.float32)
+class ParallaxEstimator:
+    def __init__(self, workers=config.FFT_WORKERS, chunk=config.PARALLAX_BATCH_CHUNK):
+        self.workers = workers
+        self.chunk = max(1, chunk)
+        self._plans = {}
+    def plan(self, shape, scale=1.0):
+        p = self._plans.get((shape, scale))
+        if p is None:
+            p = self._plans[shape, scale] = _Plan(*shape, scale)
+        return p
+    def estimate(self, img):
+        a = spectrum.analyze(img, self.workers)
+        if a is None:
+            return 0, 0, 0, 0, 0
+        p = self.plan(a.shape)
+        np.multiply(p.masks, a.windowed_power, out=p.psd)
+        autocorr = scipy.fft.irfft2(p.psd, s=p.shape, workers=self.workers)
+        dnx, dny, c_n = self._layer_shift(p, autocorr[0])
+        dfx, dfy, c_f = self._layer_shift(p, autocorr[1])
+        return dnx, dny, dfx, dfy, (c_n + c_f) / 2.0
+    def estimate_many(self, stack):
+        out = np.zeros((len(stack), 5))
+        if len(stack) == 0:
+            return out
+        p = self.plan(stack.shape[1:3])
+        step = min(self.chunk, max(1, (config.PARALLAX_BATCH_MB << 20) // (20 * p.shape[0] * p.shape[1])))
+        for start in range(0, len(stack), step):
+            chunk = _gray_stack(stack[start:start + step])
+            out[start:start + len(chunk)] = self._batch(p, chunk)
+        return out
+    def estimate_field(self, img, tile=config.FIELD_TILE, stride=config.FIELD_STRIDE):
+        a = spectrum.analyze(img, self.workers)
+        if a is None:
+            return None
+        gray = a.gray.astype(np.float32)
+        tiles = np.lib.stride_tricks.sliding_window_view(gray, (tile, tile))[::stride, ::stride]
+        return self._batch(self.plan((tile, tile), tile / float(config.CANONICAL_SIZE)), tiles)
+    def _batch(self, p, frames):
+        s = scipy.fft.rfft2(frames * spectrum.hann_window(*p.shape), workers=self.workers)
+        power = s.real**2 + s.imag**2
+        autocorr = scipy.fft.irfft2(p.masks * power[..., np.newaxis, :, :], s=p.shape, workers=self.workers, overwrite_x=True)
+        dx, dy, conf = self._layer_shifts(p, autocorr)
+        return np.stack([dx[..., 0], dy[..., 0], dx[..., 1], dy[..., 1], conf.mean(axis=-1)], axis=-1).astype(np.float64)
+    def _layer_shifts(self, p, autocorr):
+        flat = np.abs(autocorr, out=autocorr).reshape(autocorr.shape[:-2] + (-1,))
+        flat[..., p.peak_idx] = 0
+        idx = flat.argmax(axis=-1)
+        max_val = np.take_along_axis(flat, idx[..., np.newaxis], axis=-1)[..., 0]
+        mean_val = flat.mean(axis=-1, dtype=np.float64)
+        mean_val[mean_val == 0] = 1e-5
+        conf = np.minimum(1.0, (max_val / mean_val) / 100.0)
+        y, x = np.divmod(idx, p.shape[1])
+        dx = (x + p.ccol) % p.shape[1] - p.ccol
+        dy = (y + p.crow) % p.shape[0] - p.crow
+        flip = (dy > 0) | ((dy == 0) & (dx > 0))
+        return np.where(flip, -dx, dx), np.where(flip, -dy, dy), conf
+    def _layer_shift(self, p, autocorr):
+        rows, cols = p.shape
+        crow, ccol = p.crow, p.ccol
+        out = p.autocorr
+        r0, c0 = rows - crow, cols - ccol
+        np.abs(autocorr[r0:, c0:], out=out[:crow, :ccol])
+        np.abs(autocorr[r0:, :c0], out=out[:crow, ccol:])
+        np.abs(autocorr[:r0, c0:], out=out[crow:, :ccol])
+        np.abs(autocorr[:r0, :c0], out=out[crow:, ccol:])
+        cv2.circle(out, (ccol, crow), config.PEAK_MASK_RADIUS, 0, -1)
+        _, max_val, _, max_loc = cv2.minMaxLoc(out)
+        mean_val = float(np.mean(out, dtype=np.float64))
         if mean_val == 0: mean_val = 1e-5
         conf = min(1.0, (max_val / mean_val) / 100.0)
         dx = max_loc[0] - ccol
         dy = max_loc[1] - crow
+        if dy > 0 or (dy == 0 and dx > 0):
+            dx, dy = -dx, -dy
         return float(dx), float(dy), float(conf)
-    dnx, dny, c_n = get_layer_shift(mask_near)
-    dfx, dfy, c_f = get_layer_shift(mask_far)
-    return dnx, dny, dfx, dfy, (c_n + c_f) / 2.0
+_estimator = None
+def calculate_parallax_shift(img):
+    global _estimator
+    if _estimator is None:
+        _estimator = ParallaxEstimator()
+    return _estimator.estimate(img)
+def calculate_parallax_field(img):
+    global _estimator
+    if _estimator is None:
+        _estimator = ParallaxEstimator()
+    return _estimator.estimate_field(img)
+def calculate_parallax_shifts(stack):
+    global _estimator
+    if _estimator is None:
+        _estimator = ParallaxEstimator()
+    return _estimator.estimate_many(stack)
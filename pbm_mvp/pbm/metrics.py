@@ -0,0 +1,157 @@
+import json
+import os
+import threading
+import time
+import numpy as np
+from . import config
+
+QUANTILES = (50, 95, 99)
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+class _Timer:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, time.perf_counter() - self.start)
+        return False
+
+class _Series:
+    def __init__(self, window):
+        self.samples = np.zeros(window)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value):
+        self.samples[self.count % len(self.samples)] = value
+        self.count += 1
+        self.total += value
+
+    def summary(self):
+        recent = self.samples[:min(self.count, len(self.samples))] * 1000.0
+        out = {"count": self.count, "mean_ms": self.total * 1000.0 / self.count}
+        for q, v in zip(QUANTILES, np.percentile(recent, QUANTILES)):
+            out[f"p{q}_ms"] = float(v)
+        return out
+
+class Profiler:
+    def __init__(self, enabled=config.METRICS_ENABLED, window=config.METRICS_WINDOW):
+        self.enabled = enabled
+        self.window = window
+        self.export_path = None
+        self.export_interval = config.METRICS_EXPORT_INTERVAL_S
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._series = {}
+            self._ticks = np.zeros(self.window)
+            self._frames = 0
+            self.counters = {}
+            self.gauges = {}
+            self._last_export = time.monotonic()
+
+    def stage(self, name):
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name)
+
+    def record(self, name, seconds):
+        with self._lock:
+            s = self._series.get(name)
+            if s is None:
+                s = self._series[name] = _Series(self.window)
+            s.add(seconds)
+
+    def count(self, name, n=1):
+        if self.enabled:
+            with self._lock:
+                self.counters[name] = self.counters.get(name, 0) + n
+
+    def gauge(self, name, value):
+        if self.enabled:
+            self.gauges[name] = value
+
+    def tick(self):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._ticks[self._frames % self.window] = time.perf_counter()
+            self._frames += 1
+        if self.export_path is not None and time.monotonic() - self._last_export >= self.export_interval:
+            self.export()
+
+    def fps(self):
+        n = min(self._frames, self.window)
+        if n < 2:
+            return 0.0
+        newest = self._ticks[(self._frames - 1) % self.window]
+        oldest = self._ticks[(self._frames - n) % self.window]
+        return (n - 1) / (newest - oldest) if newest > oldest else 0.0
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "time": time.time(),
+                "frames": self._frames,
+                "fps": self.fps(),
+                "stages": {name: s.summary() for name, s in self._series.items()},
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+            }
+
+    def export(self, path=None):
+        path = path or self.export_path
+        if path is None:
+            return
+        snap = self.snapshot()
+        if path.endswith(".prom"):
+            _write_prometheus(path, snap)
+        else:
+            with open(path, "a") as f:
+                f.write(json.dumps(snap) + "\n")
+        self._last_export = time.monotonic()
+
+def _write_prometheus(path, snap):
+    lines = [
+        "# TYPE pbm_frames_total counter",
+        f"pbm_frames_total {snap['frames']}",
+        "# TYPE pbm_fps gauge",
+        f"pbm_fps {snap['fps']:.3f}",
+        "# TYPE pbm_stage_latency_ms summary",
+    ]
+    for name, s in sorted(snap["stages"].items()):
+        for q in QUANTILES:
+            lines.append(f'pbm_stage_latency_ms{{stage="{name}",quantile="{q / 100:.2f}"}} {s[f"p{q}_ms"]:.4f}')
+        lines.append(f'pbm_stage_latency_ms_count{{stage="{name}"}} {s["count"]}')
+        lines.append(f'pbm_stage_latency_ms_sum{{stage="{name}"}} {s["mean_ms"] * s["count"]:.4f}')
+    lines.append("# TYPE pbm_events_total counter")
+    for name, v in sorted(snap["counters"].items()):
+        lines.append(f'pbm_events_total{{event="{name}"}} {v}')
+    lines.append("# TYPE pbm_gauge gauge")
+    for name, v in sorted(snap["gauges"].items()):
+        lines.append(f'pbm_gauge{{name="{name}"}} {float(v):.6g}')
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp, path)
+
+profiler = Profiler()
+
+def enable(path=None):
+    profiler.enabled = True
+    profiler.export_path = path
@@ -29,4 +29,49 @@ def normalize_roi(frame, contour):
     M = cv2.getPerspectiveTransform(rect, dst)
     warped = cv2.warpPerspective(frame, M, (config.CANONICAL_SIZE, config.CANONICAL_SIZE))
 
-    return warped
\ No newline at end of file
+    return warped
+
+class Normalizer:
+    def __init__(self, size=config.CANONICAL_SIZE, reuse_eps=config.NORMALIZE_REUSE_EPS_PX):
+        self.size = size
+        self.reuse_eps = reuse_eps
+        self.out = np.empty((size, size), dtype=np.uint8)
+        self.reused = 0
+        self._rect = None
+        self._frame_shape = None
+
+    def _plan(self, rect, frame_shape):
+        h, w = frame_shape[:2]
+        x0, y0 = np.floor(rect.min(axis=0)).astype(int) - 2
+        x1, y1 = np.ceil(rect.max(axis=0)).astype(int) + 3
+        x0, y0, x1, y1 = max(x0, 0), max(y0, 0), min(x1, w), min(y1, h)
+        dst = np.array([
+            [0, 0],
+            [self.size - 1, 0],
+            [self.size - 1, self.size - 1],
+            [0, self.size - 1]
+        ], dtype="float32")
+        self._M = cv2.getPerspectiveTransform(rect - np.float32((x0, y0)), dst)
+        self._box = (x0, y0, x1, y1)
+        if len(frame_shape) == 3:
+            self._crop = np.empty((y1 - y0, x1 - x0), dtype=np.uint8)
+        self._rect = rect
+        self._frame_shape = frame_shape
+
+    def normalize(self, frame, contour):
+        if contour is None:
+            return None
+
+        rect = order_points(contour.reshape(4, 2).astype(np.float32))
+        if self._rect is None or frame.shape != self._frame_shape or np.abs(rect - self._rect).max() > self.reuse_eps:
+            self._plan(rect, frame.shape)
+        else:
+            self.reused += 1
+
+        x0, y0, x1, y1 = self._box
+        src = frame[y0:y1, x0:x1]
+        if src.ndim == 3:
+            src = cv2.cvtColor(src, cv2.COLOR_BGR2GRAY, dst=self._crop)
+        cv2.warpPerspective(src, self._M, (self.size, self.size), dst=self.out)
+
+        return self.out
@@ -0,0 +1,93 @@
+import json
+import os
+import struct
+from . import config, keys, metrics
+
+VERSION = 1
+PREFIX = "PB:"
+FIELDS = (("f1", 1e4), ("a1", 1e2), ("f2", 1e4), ("a2", 1e2), ("rel_angle", 1e2), ("pbm_scale", 1e4))
+LAYOUT = struct.Struct(">B4s8s" + "H" * len(FIELDS))
+SIG_BYTES = 64
+BASE45 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ $%*+-./:"
+
+def b45encode(data):
+    out = []
+    for i in range(0, len(data) - 1, 2):
+        n = data[i] * 256 + data[i + 1]
+        n, c = divmod(n, 45)
+        e, d = divmod(n, 45)
+        out += [c, d, e]
+    if len(data) % 2:
+        d, c = divmod(data[-1], 45)
+        out += [c, d]
+    return "".join(BASE45[i] for i in out)
+
+def b45decode(text):
+    try:
+        vals = [BASE45.index(ch) for ch in text]
+    except ValueError:
+        raise ValueError("Invalid base45 character")
+    if len(vals) % 3 == 1:
+        raise ValueError("Invalid base45 length")
+    out = bytearray()
+    for i in range(0, len(vals), 3):
+        chunk = vals[i:i + 3]
+        n = sum(v * 45 ** k for k, v in enumerate(chunk))
+        if len(chunk) == 3:
+            if n > 0xFFFF:
+                raise ValueError("Invalid base45 chunk")
+            out += n.to_bytes(2, "big")
+        else:
+            if n > 0xFF:
+                raise ValueError("Invalid base45 chunk")
+            out.append(n)
+    return bytes(out)
+
+def sign(identity, hid, key_path=keys.PRIVATE_KEY_PATH):
+    payload = {"id": hid, "fp": identity}
+    s = json.dumps(payload, sort_keys=True)
+    k = keys.load_private_key(key_path)
+    with metrics.profiler.stage("sign"):
+        sig = k.sign(s.encode())
+    return {"data": payload, "sig": sig.hex()}
+
+def pack(identity, hid, key_path=keys.PRIVATE_KEY_PATH):
+    k = keys.load_private_key(key_path)
+    values = [min(max(int(round(identity[name] * scale)), 0), 0xFFFF) for name, scale in FIELDS]
+    body = LAYOUT.pack(VERSION, keys.key_id(k.public_key()), bytes.fromhex(hid), *values)
+    with metrics.profiler.stage("sign"):
+        return body + k.sign(body)
+
+def unpack(blob):
+    if len(blob) != LAYOUT.size + SIG_BYTES:
+        raise ValueError(f"Passport is {len(blob)} bytes, expected {LAYOUT.size + SIG_BYTES}")
+    version, kid, hid, *values = LAYOUT.unpack_from(blob)
+    if version != VERSION:
+        raise ValueError(f"Unsupported passport version {version}")
+    identity = {name: round(v / scale, 4) for (name, scale), v in zip(FIELDS, values)}
+    return kid, hid.hex(), identity, blob[:LAYOUT.size], blob[LAYOUT.size:]
+
+def encode(identity, hid, key_path=keys.PRIVATE_KEY_PATH, fmt=config.PASSPORT_FORMAT):
+    if fmt == "json":
+        return json.dumps(sign(identity, hid, key_path))
+    return PREFIX + b45encode(pack(identity, hid, key_path))
+
+def decode(text, key_path=keys.PUBLIC_KEY_PATH):
+    k = keys.load_public_key(key_path)
+    if text.startswith(PREFIX):
+        kid, hid, identity, body, sig = unpack(b45decode(text[len(PREFIX):]))
+        if kid != keys.key_id(k):
+            raise ValueError("Passport was signed with an unknown key")
+        with metrics.profiler.stage("signature"):
+            k.verify(sig, body)
+        return hid, identity
+    payload = json.loads(text)
+    s = json.dumps(payload["data"], sort_keys=True)
+    with metrics.profiler.stage("signature"):
+        k.verify(bytes.fromhex(payload["sig"]), s.encode())
+    return payload["data"]["id"], payload["data"]["fp"]
+
+def render_qr(text, path):
+    import qrcode
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    qrcode.make(text).save(path)
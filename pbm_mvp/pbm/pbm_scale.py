@@ -1,13 +1,16 @@
 import numpy as np
+from .running import RunningStats
 
-def compute_pbm_scale(parallax_history, roi_history):
-    if not parallax_history or not roi_history:
-        return None
+def _mean(history):
+    if isinstance(history, RunningStats):
+        return float(history.mean[0]) if history.n else None
+    return float(np.mean(history)) if len(history) else None
 
-    mean_parallax = np.mean(parallax_history)
-    mean_area = np.mean(roi_history)
+def compute_pbm_scale(parallax_history, roi_history):
+    mean_parallax = _mean(parallax_history)
+    mean_area = _mean(roi_history)
 
-    if mean_area <= 0:
+    if mean_parallax is None or mean_area is None or mean_area <= 0:
         return None
 
     return mean_parallax / np.sqrt(mean_area)
\ No newline at end of file
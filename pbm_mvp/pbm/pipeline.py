@@ -0,0 +1,103 @@
+import collections
+import concurrent.futures
+import os
+import threading
+import cv2
+from . import config, normalize, layers, features, spectrum, decision, quality, metrics
+
+BLOCK = "block"
+DROP = "drop"
+
+class FrameResult:
+    def __init__(self, seq, roi, area=0.0, parallax=(0, 0, 0, 0, 0), analysis=None, field=None, gated=None):
+        self.seq = seq
+        self.gated = gated
+        self.roi = roi
+        self.area = area
+        self.parallax = parallax
+        self._analysis = analysis
+        self._feats = None
+        self.field = field
+        self.coherence = None if field is None else decision.field_coherence(field)
+
+    def features(self):
+        if self._analysis is not None:
+            with metrics.profiler.stage("features"):
+                self._feats = features.extract_features(self._analysis)
+            self._analysis = None
+        return self._feats
+
+class FrameProcessor:
+    def __init__(self, detach=False):
+        self.detach = detach
+        self.normalizer = normalize.Normalizer()
+        self.estimator = layers.ParallaxEstimator()
+
+    def process(self, seq, frame, roi_cnt):
+        if roi_cnt is None:
+            return FrameResult(seq, None)
+        with metrics.profiler.stage("normalize"):
+            img = self.normalizer.normalize(frame, roi_cnt)
+            analysis = spectrum.FrameAnalysis(img.copy() if self.detach else img)
+        if config.QUALITY_GATE:
+            with metrics.profiler.stage("quality"):
+                gated = quality.check(analysis.gray)
+            if gated is not None:
+                metrics.profiler.count(f"gated_{gated}")
+                return FrameResult(seq, roi_cnt, cv2.contourArea(roi_cnt), gated=gated)
+        with metrics.profiler.stage("parallax"):
+            parallax = self.estimator.estimate(analysis)
+        field = None
+        if config.FIELD_ENABLED:
+            with metrics.profiler.stage("parallax_field"):
+                field = self.estimator.estimate_field(analysis)
+        return FrameResult(seq, roi_cnt, cv2.contourArea(roi_cnt), parallax, analysis=analysis, field=field)
+
+class FramePipeline:
+    def __init__(self, workers=config.PIPELINE_WORKERS, max_pending=config.PIPELINE_MAX_PENDING,
+                 policy=config.PIPELINE_DROP_POLICY):
+        if policy not in (BLOCK, DROP):
+            raise ValueError(f"Unknown pipeline policy {policy!r}")
+        if workers > (os.cpu_count() or 1):
+            print(f"WARNING: {workers} pipeline workers on {os.cpu_count()} CPU(s), extra threads only add overhead")
+        self.policy = policy
+        self.max_pending = max(1, max_pending)
+        self.submitted = 0
+        self.dropped = 0
+        self._pool = concurrent.futures.ThreadPoolExecutor(max(1, workers), thread_name_prefix="pbm-pipeline")
+        self._local = threading.local()
+        self._pending = collections.deque()
+
+    def _process(self, seq, frame, roi_cnt):
+        proc = getattr(self._local, "processor", None)
+        if proc is None:
+            proc = self._local.processor = FrameProcessor(detach=True)
+        return proc.process(seq, frame, roi_cnt)
+
+    def submit(self, frame, roi_cnt):
+        if len(self._pending) >= self.max_pending:
+            if self.policy == DROP:
+                self.dropped += 1
+                metrics.profiler.count("pipeline_dropped")
+                return False
+            concurrent.futures.wait([self._pending[0]])
+        self._pending.append(self._pool.submit(self._process, self.submitted, frame, roi_cnt))
+        self.submitted += 1
+        return True
+
+    def process_many(self, frame, rois):
+        futures = [self._pool.submit(self._process, key, frame, roi_cnt) for key, roi_cnt in rois.items()]
+        return [fut.result() for fut in futures]
+    def ready(self):
+        while self._pending and self._pending[0].done():
+            yield self._pending.popleft().result()
+
+    def drain(self):
+        while self._pending:
+            yield self._pending.popleft().result()
+
+    def close(self):
+        for fut in self._pending:
+            fut.cancel()
+        self._pending.clear()
+        self._pool.shutdown(wait=True)
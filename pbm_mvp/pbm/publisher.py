@@ -0,0 +1,71 @@
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from . import config, keys, passport, metrics
+
+def _publish(identity, hid, qr_path, key_path):
+    text = passport.encode(identity, hid, key_path)
+    passport.render_qr(text, qr_path)
+    return {"id": hid, "fp": identity, "passport": text, "qr": qr_path, "time": time.time()}
+
+class PassportPublisher:
+    def __init__(self, out_dir, workers=config.PUBLISH_WORKERS, batch=config.PUBLISH_BATCH,
+                 flush_s=config.PUBLISH_FLUSH_S, key_path=keys.PRIVATE_KEY_PATH):
+        self.out_dir = out_dir
+        self.index_path = os.path.join(out_dir, "index.jsonl")
+        self.batch = max(1, batch)
+        self.flush_s = flush_s
+        self.key_path = os.path.abspath(key_path)
+        self.submitted = 0
+        self.written = 0
+        self.failed = 0
+        os.makedirs(out_dir, exist_ok=True)
+        self._pool = concurrent.futures.ProcessPoolExecutor(max(1, workers), mp_context=multiprocessing.get_context("spawn"))
+        self._done = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="pbm-publisher", daemon=True)
+        self._writer.start()
+
+    def submit(self, identity, hid):
+        qr_path = os.path.join(self.out_dir, f"{hid}_{time.time_ns()}_{self.submitted}.png")
+        fut = self._pool.submit(_publish, identity, hid, qr_path, self.key_path)
+        fut.add_done_callback(self._done.put)
+        self.submitted += 1
+        metrics.profiler.count("passports_submitted")
+        return qr_path
+
+    def _write_loop(self):
+        with open(self.index_path, "a") as f:
+            while True:
+                batch = [self._done.get()]
+                deadline = time.monotonic() + self.flush_s
+                while batch[-1] is not None and len(batch) < self.batch:
+                    try:
+                        batch.append(self._done.get(timeout=max(deadline - time.monotonic(), 0.0)))
+                    except queue.Empty:
+                        break
+                lines = []
+                for fut in batch:
+                    if fut is None:
+                        continue
+                    try:
+                        lines.append(json.dumps(fut.result(), sort_keys=True))
+                    except Exception as e:
+                        self.failed += 1
+                        print(f"Passport publish failed: {e}")
+                if lines:
+                    with metrics.profiler.stage("index_write"):
+                        f.write("\n".join(lines) + "\n")
+                        f.flush()
+                        os.fsync(f.fileno())
+                    self.written += len(lines)
+                if batch[-1] is None:
+                    return
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+        self._done.put(None)
+        self._writer.join()
@@ -0,0 +1,100 @@
+import threading
+import time
+import cv2
+import numpy as np
+from . import config, metrics
+
+class QrScanner:
+    def __init__(self, detector=None, threaded=config.QR_SCAN_THREADED, interval=config.QR_SCAN_INTERVAL_S,
+                 pad=config.QR_ROI_PAD_RATIO):
+        self.detector = detector if detector is not None else cv2.QRCodeDetector()
+        self.threaded = threaded
+        self.interval = interval
+        self.pad = pad
+        self.region = None
+        self.scans = 0
+        self.region_hits = 0
+        self._result = ""
+        self._frame = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        if threaded:
+            self._thread = threading.Thread(target=self._loop, name="pbm-qr", daemon=True)
+            self._thread.start()
+
+    def _detect(self, img):
+        if isinstance(self.detector, cv2.wechat_qrcode_WeChatQRCode):
+            res, points = self.detector.detectAndDecode(img)
+            if not res:
+                return "", None
+            return res[0], np.asarray(points[0], dtype=np.float32)
+        text, points, _ = self.detector.detectAndDecode(img)
+        if not text or points is None:
+            return "", None
+        return text, points.reshape(-1, 2)
+
+    def _remember(self, pts, shape):
+        x, y, w, h = cv2.boundingRect(pts.astype(np.int32))
+        px, py = int(w * self.pad), int(h * self.pad)
+        self.region = (max(x - px, 0), max(y - py, 0), min(x + w + px, shape[1]), min(y + h + py, shape[0]))
+
+    def decode(self, frame):
+        self.scans += 1
+        with metrics.profiler.stage("qr_decode"):
+            if self.region is not None:
+                x0, y0, x1, y1 = self.region
+                text, pts = self._detect(frame[y0:y1, x0:x1])
+                if text:
+                    self.region_hits += 1
+                    self._remember(pts + np.float32((x0, y0)), frame.shape)
+                    return text
+            text, pts = self._detect(frame)
+        if text:
+            self._remember(pts, frame.shape)
+        else:
+            self.region = None
+        return text
+
+    def submit(self, frame):
+        if not self.threaded:
+            self._result = self.decode(frame)
+            return
+        with self._lock:
+            self._frame = frame
+        self._wake.set()
+
+    def poll(self):
+        with self._lock:
+            text, self._result = self._result, ""
+        return text
+
+    def reset(self):
+        with self._lock:
+            self._frame = None
+            self._result = ""
+        self.region = None
+
+    def _loop(self):
+        while not self._stop.is_set():
+            if not self._wake.wait(0.1):
+                continue
+            self._wake.clear()
+            with self._lock:
+                frame, self._frame = self._frame, None
+            if frame is None:
+                continue
+            start = time.monotonic()
+            text = self.decode(frame)
+            if text:
+                with self._lock:
+                    self._result = text
+            self._stop.wait(max(self.interval - (time.monotonic() - start), 0.0))
+
+    def release(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
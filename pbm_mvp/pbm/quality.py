@@ -0,0 +1,25 @@
+import cv2
+from . import config
+
+BLUR = "blur"
+SATURATED = "saturated"
+LOW_CONTRAST = "low_contrast"
+
+def score(gray, levels=config.QUALITY_PYR_LEVELS):
+    small = gray
+    for _ in range(levels):
+        small = cv2.pyrDown(small)
+    _, lap_sd = cv2.meanStdDev(cv2.Laplacian(small, cv2.CV_16S))
+    _, sd = cv2.meanStdDev(small)
+    clipped = cv2.countNonZero(cv2.inRange(small, config.QUALITY_DARK_LEVEL + 1, config.QUALITY_BRIGHT_LEVEL - 1))
+    return float(lap_sd[0, 0]) ** 2, 1.0 - clipped / float(small.size), float(sd[0, 0])
+
+def check(gray):
+    sharpness, saturation, contrast = score(gray)
+    if saturation > config.QUALITY_MAX_SATURATION:
+        return SATURATED
+    if contrast < config.QUALITY_MIN_CONTRAST:
+        return LOW_CONTRAST
+    if sharpness < config.QUALITY_MIN_SHARPNESS:
+        return BLUR
+    return None
@@ -0,0 +1,88 @@
+import json
+import os
+import time
+import numpy as np
+
+FEATURES = ("f1", "a1", "f2", "a2", "rel_angle")
+COLUMNS = (
+    ("time", "<f8"),
+    ("dnx", "<f4"), ("dny", "<f4"), ("dfx", "<f4"), ("dfy", "<f4"), ("conf", "<f4"),
+    ("area", "<f4"), ("roi", "u1"), ("gated", "u1"), ("coherence", "<f4"),
+) + tuple((k, "<f4") for k in FEATURES)
+META = "meta.json"
+
+class SessionRecorder:
+    def __init__(self, path, label=None, token=None, flush_every=64):
+        self.path = path
+        self.flush_every = flush_every
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, META)
+        if not os.path.exists(meta_path):
+            with open(meta_path, "w") as f:
+                json.dump({"columns": COLUMNS, "label": label, "token": token, "created": time.time()}, f)
+        self._files = {name: open(os.path.join(path, name + ".col"), "ab") for name, _ in COLUMNS}
+        self._rows = []
+        self._start = time.monotonic()
+        self.frames = 0
+
+    def add(self, res):
+        feats = res.features() if res.roi is not None and not res.gated else None
+        dnx, dny, dfx, dfy, conf = res.parallax
+        row = [time.monotonic() - self._start, dnx, dny, dfx, dfy, conf, res.area,
+               res.roi is not None, bool(res.gated), np.nan if res.coherence is None else res.coherence]
+        row += [feats[k] if feats else np.nan for k in FEATURES]
+        self._rows.append(row)
+        self.frames += 1
+        if len(self._rows) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if not self._rows:
+            return
+        cols = list(zip(*self._rows))
+        for (name, dtype), values in zip(COLUMNS, cols):
+            f = self._files[name]
+            f.write(np.asarray(values, dtype=dtype).tobytes())
+            f.flush()
+        self._rows = []
+
+    def close(self):
+        self.flush()
+        for f in self._files.values():
+            f.close()
+
+class Recording:
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META)) as f:
+            self.meta = json.load(f)
+        self.columns = {}
+        for name, dtype in self.meta["columns"]:
+            col = os.path.join(path, name + ".col")
+            size = os.path.getsize(col) if os.path.exists(col) else 0
+            if size:
+                self.columns[name] = np.memmap(col, dtype=dtype, mode="r")
+            else:
+                self.columns[name] = np.zeros(0, dtype=dtype)
+        self.frames = min(len(c) for c in self.columns.values())
+
+    def __len__(self):
+        return self.frames
+
+    def __getitem__(self, name):
+        return self.columns[name][:self.frames]
+
+    @property
+    def label(self):
+        return self.meta.get("label")
+
+    @property
+    def token(self):
+        return self.meta.get("token")
+
+    def parallax(self):
+        return np.column_stack([self[k] for k in ("dnx", "dny", "dfx", "dfy", "conf")]).astype(np.float64)
+
+    def coherence(self):
+        c = self["coherence"]
+        return None if np.isnan(c).all() else np.nan_to_num(c, nan=1.0)
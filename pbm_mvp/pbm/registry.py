@@ -0,0 +1,127 @@
+import os
+import queue
+import threading
+import time
+import numpy as np
+from . import config
+
+FIELDS = ("f1", "a1", "f2", "a2", "rel_angle", "pbm_scale")
+RECORD = np.dtype([("id", "<u8"), ("fp", "<f4", (len(FIELDS),))])
+_F1, _F2, _REL, _SCALE = (FIELDS.index(k) for k in ("f1", "f2", "rel_angle", "pbm_scale"))
+
+def tolerances():
+    return np.array([config.FINGERPRINT_FREQ_TOL, config.FINGERPRINT_FREQ_TOL, config.FINGERPRINT_ANGLE_TOL, config.PBM_SCALE_EPS])
+
+def distances(fps, fp):
+    d = np.abs(fps[:, [_F1, _F2, _REL, _SCALE]] - fp[[_F1, _F2, _REL, _SCALE]])
+    d[:, 2] %= 180.0
+    d[:, 2] = np.minimum(d[:, 2], 180.0 - d[:, 2])
+    return d / tolerances()
+
+def _angle_cells():
+    return max(1, int(180.0 // config.FINGERPRINT_ANGLE_TOL))
+
+def _cells(fps):
+    fps = np.atleast_2d(fps)
+    n = _angle_cells()
+    i1 = np.floor(fps[:, _F1] / config.FINGERPRINT_FREQ_TOL).astype(np.int64)
+    i2 = np.floor(fps[:, _F2] / config.FINGERPRINT_FREQ_TOL).astype(np.int64)
+    ia = np.floor((fps[:, _REL] % 180.0) * (n / 180.0)).astype(np.int64) % n
+    iscale = np.floor(fps[:, _SCALE] / config.PBM_SCALE_EPS).astype(np.int64)
+    return i1, i2, ia, iscale
+
+def _key(i1, i2, ia, iscale):
+    return ((i1 & 0xFFFF) << 48) | ((i2 & 0xFFFF) << 32) | ((ia & 0xFFFF) << 16) | (iscale & 0xFFFF)
+
+def as_vector(identity):
+    return np.array([identity[k] for k in FIELDS], dtype=np.float32)
+
+class Registry:
+    def __init__(self, path=config.REGISTRY_PATH):
+        self.path = path
+        recs = np.fromfile(path, dtype=RECORD) if os.path.exists(path) else np.zeros(0, RECORD)
+        self._n = len(recs)
+        self._ids = np.zeros(max(1024, self._n), dtype=np.uint64)
+        self._fps = np.zeros((len(self._ids), len(FIELDS)), dtype=np.float32)
+        self._ids[:self._n] = recs["id"]
+        self._fps[:self._n] = recs["fp"]
+        self._grid = {}
+        self._queue = queue.Queue()
+        self._writer = None
+        if self._n:
+            keys = _key(*_cells(self._fps[:self._n]))
+            order = np.argsort(keys, kind="stable")
+            uniq, starts = np.unique(keys[order], return_index=True)
+            for k, rows in zip(uniq.tolist(), np.split(order, starts[1:])):
+                self._grid[k] = rows.tolist()
+
+    def __len__(self):
+        return self._n
+
+    def add(self, identity, hid):
+        fp = as_vector(identity)
+        rec = np.zeros(1, RECORD)
+        rec["id"] = int(hid, 16)
+        rec["fp"] = fp
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._write_loop, name="pbm-registry", daemon=True)
+            self._writer.start()
+        self._queue.put(rec)
+        if self._n == len(self._ids):
+            self._ids = np.resize(self._ids, 2 * self._n)
+            self._fps = np.resize(self._fps, (2 * self._n, len(FIELDS)))
+        self._ids[self._n] = rec["id"][0]
+        self._fps[self._n] = fp
+        self._grid.setdefault(int(_key(*_cells(fp))[0]), []).append(self._n)
+        self._n += 1
+        return self._n - 1
+
+    def _write_loop(self):
+        with open(self.path, "ab") as f:
+            while True:
+                batch = [self._queue.get()]
+                deadline = time.monotonic() + config.REGISTRY_FLUSH_S
+                while batch[-1] is not None:
+                    try:
+                        batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0.0)))
+                    except queue.Empty:
+                        break
+                recs = [r for r in batch if r is not None]
+                if recs:
+                    np.concatenate(recs).tofile(f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                if batch[-1] is None:
+                    return
+
+    def close(self):
+        if self._writer is not None:
+            self._queue.put(None)
+            self._writer.join()
+            self._writer = None
+
+    def _candidates(self, fp):
+        i1, i2, ia, iscale = (int(c[0]) for c in _cells(fp))
+        n = _angle_cells()
+        rows = []
+        for d1 in (-1, 0, 1):
+            for d2 in (-1, 0, 1):
+                for da in (-1, 0, 1):
+                    for ds in (-1, 0, 1):
+                        rows += self._grid.get(_key(i1 + d1, i2 + d2, (ia + da) % n, iscale + ds), ())
+        return np.array(rows, dtype=np.int64)
+
+    def query(self, identity, limit=None):
+        fp = as_vector(identity)
+        rows = self._candidates(fp)
+        if len(rows) == 0:
+            return []
+        dist = distances(self._fps[rows], fp)
+        ok = (dist < 1.0).all(axis=1)
+        rows, score = rows[ok], dist[ok].max(axis=1)
+        order = np.argsort(score)[:limit]
+        return [(f"{int(self._ids[r]):016x}", float(s)) for r, s in zip(rows[order], score[order])]
+
+    def find_duplicate(self, identity):
+        matches = self.query(identity, 1)
+        return matches[0][0] if matches else None
@@ -0,0 +1,188 @@
+import fcntl
+import os
+import threading
+import numpy as np
+from . import config
+
+MAGIC = b"PBIX"
+VERSION = 1
+ENTRY = np.dtype([("id", "<u8"), ("value", "<i4")])
+REVOKED = 1
+RESTORED = 0
+
+def hid_int(hid):
+    return int(hid, 16) if isinstance(hid, str) else int(hid)
+
+def entries(hids, value):
+    out = np.zeros(len(hids), ENTRY)
+    out["id"] = [hid_int(h) for h in hids]
+    out["value"] = value
+    return out
+
+def read_delta(path):
+    with open(path, "rb") as f:
+        head = f.read(len(MAGIC) + 1)
+        if head[:len(MAGIC)] != MAGIC or head[len(MAGIC):] != bytes([VERSION]):
+            raise ValueError(f"{path} is not a version {VERSION} index delta")
+        data = f.read()
+    return np.frombuffer(data[:len(data) - len(data) % ENTRY.itemsize], dtype=ENTRY)
+
+def write_delta(path, delta, append=False):
+    data = np.asarray(delta, dtype=ENTRY).tobytes()
+    while True:
+        with open(path, "ab" if append else "wb") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            st = os.fstat(f.fileno())
+            try:
+                current = os.stat(path).st_ino
+            except FileNotFoundError:
+                current = None
+            if current != st.st_ino:
+                continue
+            if st.st_size == 0:
+                f.write(MAGIC + bytes([VERSION]))
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+            return
+
+def _lock(path, flags):
+    try:
+        f = open(path, "a")
+    except OSError:
+        return None
+    try:
+        fcntl.flock(f, flags)
+    except BlockingIOError:
+        f.close()
+        return None
+    return f
+
+def _load(path):
+    n = os.path.getsize(path) // ENTRY.itemsize if os.path.exists(path) else 0
+    if n == 0:
+        return np.zeros(0, "<u8"), np.zeros(0, "<i4")
+    return np.memmap(path, "<u8", "r", 0, n), np.memmap(path, "<i4", "r", 8 * n, n)
+
+class SortedIndex:
+    additive = False
+
+    def __init__(self, path, auto_compact=False):
+        self.path = path
+        self.delta_path = path + ".delta"
+        self.frozen_path = path + ".frozen"
+        self.lock_path = path + ".lock"
+        self.auto_compact = auto_compact
+        self._lock = threading.Lock()
+        self._compactor = None
+        lock = _lock(self.lock_path, fcntl.LOCK_SH)
+        try:
+            self._state = self._read()
+        finally:
+            if lock is not None: lock.close()
+
+    def _read(self):
+        ids, values = _load(self.path)
+        delta = {}
+        for path in (self.frozen_path, self.delta_path):
+            if os.path.exists(path):
+                self._merge(delta, read_delta(path))
+        return ids, values, delta
+
+    def _merge(self, overlay, delta):
+        ids, values = delta["id"], delta["value"]
+        if not self.additive:
+            overlay.update(zip(ids.tolist(), values.tolist()))
+            return
+        ids, inv = np.unique(ids, return_inverse=True)
+        for h, v in zip(ids.tolist(), np.bincount(inv, values).astype(np.int64).tolist()):
+            overlay[h] = overlay.get(h, 0) + v
+
+    def pending(self):
+        return len(self._state[2])
+
+    def get(self, hid):
+        h = hid_int(hid)
+        ids, values, delta = self._state
+        if not self.additive and h in delta:
+            return delta[h]
+        i = int(np.searchsorted(ids, np.uint64(h)))
+        base = int(values[i]) if i < len(ids) and int(ids[i]) == h else 0
+        return base + delta.get(h, 0)
+
+    def apply(self, delta):
+        if len(delta) == 0:
+            return
+        with self._lock:
+            write_delta(self.delta_path, delta, append=True)
+            self._merge(self._state[2], delta)
+        if self.auto_compact and self.pending() >= config.INDEX_COMPACT_AT and (self._compactor is None or not self._compactor.is_alive()):
+            self._compactor = threading.Thread(target=self.compact, args=(False,), name="pbm-index-compact")
+            self._compactor.start()
+
+    def _freeze(self):
+        if os.path.exists(self.frozen_path) or not os.path.exists(self.delta_path):
+            return
+        with open(self.delta_path, "ab") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            os.replace(self.delta_path, self.frozen_path)
+
+    def compact(self, block=True):
+        lock = _lock(self.lock_path, fcntl.LOCK_EX if block else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        if lock is None:
+            return False
+        try:
+            self._freeze()
+            if os.path.exists(self.frozen_path):
+                self._rewrite(read_delta(self.frozen_path))
+                os.remove(self.frozen_path)
+            with self._lock:
+                self._state = self._read()
+        finally:
+            lock.close()
+        return True
+
+    def _rewrite(self, delta):
+        base_ids, base_values = _load(self.path)
+        ids = np.concatenate([base_ids, delta["id"]])
+        values = np.concatenate([base_values, delta["value"]])
+        if self.additive:
+            ids, inv = np.unique(ids, return_inverse=True)
+            values = np.bincount(inv, values).astype(np.int32)
+        else:
+            ids, last = np.unique(ids[::-1], return_index=True)
+            values = values[::-1][last]
+        keep = values != 0
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            ids[keep].astype("<u8").tofile(f)
+            values[keep].astype("<i4").tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+class RevocationList(SortedIndex):
+    def __init__(self, path=config.REVOCATION_PATH):
+        super().__init__(path)
+
+    def __contains__(self, hid):
+        return self.get(hid) == REVOKED
+
+    def revoke(self, hids):
+        self.apply(entries(hids, REVOKED))
+
+    def restore(self, hids):
+        self.apply(entries(hids, RESTORED))
+
+    def sync(self, delta_path):
+        self.apply(read_delta(delta_path))
+
+class SeenIndex(SortedIndex):
+    additive = True
+
+    def __init__(self, path=config.SEEN_PATH, auto_compact=True):
+        super().__init__(path, auto_compact)
+
+    def record(self, hid):
+        self.apply(entries([hid], 1))
+        return self.get(hid)
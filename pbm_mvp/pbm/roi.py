@@ -1,19 +1,18 @@
 import cv2
 import numpy as np
 from . import config
-def find_roi(frame):
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+def _edges(gray):
     blurred = cv2.GaussianBlur(gray, (5, 5), 0)
     edged = cv2.Canny(blurred, 50, 150)
     kernel = np.ones((3,3), np.uint8)
-    edged = cv2.dilate(edged, kernel, iterations=1)
-    contours, _ = cv2.findContours(edged, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    frame_area = frame.shape[0] * frame.shape[1]
-    best_cnt = None
-    max_area = 0
+    return cv2.dilate(edged, kernel, iterations=1)
+def _quads(edged, frame_area, area_scale=1.0, min_ratio=None, mode=cv2.RETR_EXTERNAL):
+    min_ratio = config.ROI_MIN_AREA_RATIO if min_ratio is None else min_ratio
+    contours, _ = cv2.findContours(edged, mode, cv2.CHAIN_APPROX_SIMPLE)
+    quads = []
     for cnt in contours:
-        area = cv2.contourArea(cnt)
-        if area < frame_area * config.ROI_MIN_AREA_RATIO or area > frame_area * config.ROI_MAX_AREA_RATIO:
+        area = cv2.contourArea(cnt) * area_scale
+        if area < frame_area * min_ratio or area > frame_area * config.ROI_MAX_AREA_RATIO:
             continue
         peri = cv2.arcLength(cnt, True)
         approx = cv2.approxPolyDP(cnt, config.ROI_RECT_CLOSENESS * peri, True)
@@ -21,7 +20,134 @@ def find_roi(frame):
             _, _, w, h = cv2.boundingRect(approx)
             aspect_ratio = float(w)/h
             if abs(aspect_ratio - 1.0) < config.ROI_ASPECT_RATIO_TOLERANCE:
-                if area > max_area:
-                    max_area = area
-                    best_cnt = approx
+                quads.append((area, approx))
+    return quads
+def find_roi(frame):
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    frame_area = frame.shape[0] * frame.shape[1]
+    best_cnt = None
+    max_area = 0
+    for area, approx in _quads(_edges(gray), frame_area):
+        if area > max_area:
+            max_area = area
+            best_cnt = approx
     return best_cnt
+def _contains(outer, inner):
+    return all(cv2.pointPolygonTest(outer, (float(x), float(y)), False) >= 0 for x, y in inner.reshape(-1, 2))
+def _innermost(quads, dup_ratio=config.ROI_NEST_DUP_RATIO):
+    kept = []
+    for area, approx in sorted(quads, key=lambda q: -q[0]):
+        if not any(area > a * dup_ratio and _contains(k, approx) for a, k in kept):
+            kept.append((area, approx))
+    return [(a, k) for i, (a, k) in enumerate(kept) if not any(j != i and _contains(k, q) for j, (_, q) in enumerate(kept))]
+def match_quads(old, new, ratio=config.ROI_TRACK_MATCH_RATIO):
+    assigned = {}
+    if old and new:
+        a = np.float32([q.reshape(4, 2).mean(axis=0) for q in old])
+        b = np.float32([q.reshape(4, 2).mean(axis=0) for q in new])
+        size = np.float32([np.sqrt(cv2.contourArea(q)) for q in old])
+        dist = np.linalg.norm(a[:, None] - b[None], axis=2)
+        for flat in np.argsort(dist, axis=None):
+            r, c = divmod(int(flat), len(new))
+            if dist[r, c] > size[r] * ratio:
+                break
+            if r in assigned or c in assigned.values():
+                continue
+            assigned[r] = c
+    return assigned
+def find_rois(frame, levels=config.ROI_TRACK_PYR_LEVELS, min_ratio=config.ROI_MULTI_MIN_AREA_RATIO):
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    small = gray
+    for _ in range(levels):
+        small = cv2.pyrDown(small)
+    scale = gray.shape[1] / small.shape[1]
+    quads = sorted(_innermost(_quads(_edges(small), gray.shape[0] * gray.shape[1], scale * scale, min_ratio, cv2.RETR_LIST)), key=lambda q: -q[0])
+    return [approx.astype(np.float32) * np.float32(scale) for _, approx in quads]
+class RoiTracker:
+    def __init__(self, levels=config.ROI_TRACK_PYR_LEVELS, pad=config.ROI_TRACK_PAD_RATIO, subpix_win=config.ROI_SUBPIX_WIN):
+        self.levels = levels
+        self.pad = pad
+        self.subpix_win = subpix_win
+        self.quad = None
+        self.tracked = False
+    def reset(self):
+        self.quad = None
+        self.tracked = False
+    def _window(self, shape):
+        x, y, w, h = cv2.boundingRect(self.quad.astype(np.int32))
+        px, py = int(w * self.pad), int(h * self.pad)
+        x0, y0 = max(x - px, 0), max(y - py, 0)
+        x1, y1 = min(x + w + px, shape[1]), min(y + h + py, shape[0])
+        return x0, y0, x1, y1
+    def _search(self, gray, frame_area, window=None):
+        x0, y0 = 0, 0
+        if window is not None:
+            x0, y0, x1, y1 = window
+            gray = gray[y0:y1, x0:x1]
+        small = gray
+        for _ in range(self.levels):
+            small = cv2.pyrDown(small)
+        scale = gray.shape[1] / small.shape[1]
+        quads = _quads(_edges(small), frame_area, scale * scale)
+        if not quads:
+            return None
+        _, approx = max(quads, key=lambda q: q[0])
+        return approx.astype(np.float32) * np.float32(scale) + np.float32((x0, y0))
+    def _refine(self, gray, quad):
+        win = (self.subpix_win, self.subpix_win)
+        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 20, 0.05)
+        return cv2.cornerSubPix(gray, quad.copy(), win, (-1, -1), criteria)
+    def find(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        frame_area = frame.shape[0] * frame.shape[1]
+        quad = None
+        if self.quad is not None:
+            quad = self._search(gray, frame_area, self._window(gray.shape))
+        self.tracked = quad is not None
+        if quad is None:
+            quad = self._search(gray, frame_area)
+        if quad is not None and self.subpix_win > 0:
+            quad = self._refine(gray, quad)
+        self.quad = quad
+        return quad
+class MultiRoiTracker:
+    def __init__(self, levels=config.ROI_TRACK_PYR_LEVELS, subpix_win=config.ROI_SUBPIX_WIN,
+                 match_ratio=config.ROI_TRACK_MATCH_RATIO, max_misses=config.ROI_TRACK_MAX_MISSES):
+        self.levels = levels
+        self.subpix_win = subpix_win
+        self.match_ratio = match_ratio
+        self.max_misses = max_misses
+        self.tracks = {}
+        self.misses = {}
+        self.next_id = 0
+    def reset(self):
+        self.tracks = {}
+        self.misses = {}
+        self.next_id = 0
+    def _match(self, quads):
+        ids = list(self.tracks)
+        return {ids[r]: c for r, c in match_quads([self.tracks[i] for i in ids], quads, self.match_ratio).items()}
+    def find(self, frame):
+        quads = find_rois(frame, self.levels)
+        if quads and self.subpix_win > 0:
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            win = (self.subpix_win, self.subpix_win)
+            criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 20, 0.05)
+            quads = [cv2.cornerSubPix(gray, q, win, (-1, -1), criteria) for q in quads]
+        assigned = self._match(quads)
+        for tid in list(self.tracks):
+            if tid in assigned:
+                self.tracks[tid] = quads[assigned[tid]]
+                self.misses[tid] = 0
+                continue
+            self.misses[tid] += 1
+            if self.misses[tid] > self.max_misses:
+                del self.tracks[tid], self.misses[tid]
+        taken = set(assigned.values())
+        for c, q in enumerate(quads):
+            if c not in taken:
+                self.tracks[self.next_id] = q
+                self.misses[self.next_id] = 0
+                assigned[self.next_id] = c
+                self.next_id += 1
+        return {tid: quads[c] for tid, c in sorted(assigned.items())}
@@ -0,0 +1,28 @@
+import numpy as np
+
+class RunningStats:
+    def __init__(self, width=1):
+        self.n = 0
+        self.mean = np.zeros(width)
+        self._m2 = np.zeros(width)
+
+    def __len__(self):
+        return self.n
+
+    def add(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self._m2 += delta * (x - self.mean)
+
+    @property
+    def var(self):
+        return self._m2 / (self.n - 1) if self.n > 1 else np.zeros_like(self._m2)
+
+    @property
+    def std(self):
+        return np.sqrt(self.var)
+
+    @property
+    def sem(self):
+        return self.std / np.sqrt(max(self.n, 1))
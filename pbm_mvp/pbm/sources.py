@@ -0,0 +1,86 @@
+import abc
+import os
+import cv2
+import numpy as np
+from . import camera
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+class FrameSource(abc.ABC):
+    @abc.abstractmethod
+    def get_frame(self):
+        pass
+
+    def release(self):
+        pass
+
+    def __iter__(self):
+        while True:
+            frame = self.get_frame()
+            if frame is None:
+                return
+            yield frame
+
+def _as_bgr(frame):
+    if frame.ndim == 2:
+        return cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+    return frame
+
+class VideoFileSource(FrameSource):
+    def __init__(self, path):
+        self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            raise RuntimeError(f"Could not open video {path}")
+
+    def get_frame(self):
+        ret, frame = self.cap.read()
+        if not ret:
+            return None
+        return frame
+
+    def release(self):
+        self.cap.release()
+
+class ImageDirSource(FrameSource):
+    def __init__(self, path):
+        self.paths = sorted(
+            os.path.join(path, name) for name in os.listdir(path)
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        if not self.paths:
+            raise RuntimeError(f"No frames found in {path}")
+        self.index = 0
+
+    def get_frame(self):
+        while self.index < len(self.paths):
+            frame = cv2.imread(self.paths[self.index], cv2.IMREAD_COLOR)
+            self.index += 1
+            if frame is not None:
+                return frame
+        return None
+
+class NpyStackSource(FrameSource):
+    def __init__(self, path):
+        self.frames = np.load(path, mmap_mode="r")
+        if self.frames.ndim not in (3, 4):
+            raise RuntimeError(f"Expected an (N, H, W[, 3]) frame stack in {path}, got shape {self.frames.shape}")
+        self.index = 0
+
+    def get_frame(self):
+        if self.frames is None or self.index >= len(self.frames):
+            return None
+        frame = np.asarray(self.frames[self.index])
+        self.index += 1
+        return _as_bgr(frame)
+
+    def release(self):
+        self.frames = None
+
+def open_source(spec):
+    if isinstance(spec, int) or str(spec).isdigit():
+        return camera.Camera(int(spec))
+    if os.path.isdir(spec):
+        return ImageDirSource(spec)
+    if str(spec).lower().endswith(".npy"):
+        return NpyStackSource(spec)
+    return VideoFileSource(spec)
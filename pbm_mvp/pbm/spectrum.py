@@ -0,0 +1,75 @@
+import cv2
+import numpy as np
+import scipy.fft
+from . import config
+
+class FrameAnalysis:
+    def __init__(self, img, workers=config.FFT_WORKERS):
+        self.img = img
+        self.workers = workers
+        self._cache = {}
+
+    def derive(self, key, fn):
+        if key not in self._cache:
+            self._cache[key] = fn(self)
+        return self._cache[key]
+
+    @property
+    def shape(self):
+        return self.img.shape[:2]
+
+    @property
+    def gray(self):
+        return self.derive("gray", _gray)
+
+    @property
+    def spectrum(self):
+        return self.derive("spectrum", _spectrum)
+
+    @property
+    def windowed_spectrum(self):
+        return self.derive("windowed_spectrum", _windowed_spectrum)
+
+    @property
+    def windowed_power(self):
+        return self.derive("windowed_power", _windowed_power)
+
+    @property
+    def magnitude(self):
+        return self.derive("magnitude", _magnitude)
+
+def _gray(a):
+    img = a.img
+    return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if len(img.shape) == 3 else img
+
+def _spectrum(a):
+    return scipy.fft.rfft2(a.gray.astype(np.float32), workers=a.workers)
+
+_windows = {}
+
+def hann_window(rows, cols):
+    w = _windows.get((rows, cols))
+    if w is None:
+        w = _windows[rows, cols] = (np.hanning(rows)[:, np.newaxis] * np.hanning(cols)[np.newaxis, :]).astype(np.float32)
+    return w
+
+def _windowed_spectrum(a):
+    return scipy.fft.rfft2(a.gray.astype(np.float32) * hann_window(*a.shape), workers=a.workers)
+
+def _windowed_power(a):
+    s = a.windowed_spectrum
+    return s.real**2 + s.imag**2
+
+def _magnitude(a):
+    rows, cols = a.shape
+    half = np.abs(a.spectrum)
+    full = np.empty((rows, cols), dtype=half.dtype)
+    full[:, :half.shape[1]] = half
+    mirror = half[(-np.arange(rows)) % rows]
+    full[:, half.shape[1]:] = mirror[:, cols - half.shape[1]:0:-1]
+    return np.fft.fftshift(full)
+
+def analyze(img, workers=config.FFT_WORKERS):
+    if img is None or isinstance(img, FrameAnalysis):
+        return img
+    return FrameAnalysis(img, workers)
@@ -0,0 +1,109 @@
+import functools
+import cv2
+import numpy as np
+from . import config
+
+@functools.lru_cache(maxsize=16)
+def create_grid(size, spacing, angle_deg, thickness=1, lines_only=False):
+    padding = int(size * 0.5)
+    full_size = size + 2 * padding
+    img = np.zeros((full_size, full_size), dtype=np.uint8)
+    img.fill(255)
+
+    for x in range(0, full_size, spacing):
+        cv2.line(img, (x, 0), (x, full_size), (0, 0, 0), thickness)
+
+    if not lines_only:
+        for y in range(0, full_size, spacing):
+            cv2.line(img, (0, y), (full_size, y), (0, 0, 0), thickness)
+
+    center = (full_size // 2, full_size // 2)
+    M = cv2.getRotationMatrix2D(center, angle_deg, 1.0)
+    rotated = cv2.warpAffine(img, M, (full_size, full_size), borderValue=255)
+
+    crop = rotated[padding:padding + size, padding:padding + size]
+    crop.flags.writeable = False
+    return crop
+
+def render_token(size=config.CANONICAL_SIZE, tilt=(0.0, 0.0), depth=1.0, near=(8, 7.0), far=(16, 95.0),
+                 scale_gain=0.3, rot_gain=12.0, shift_gain=40.0, border=12):
+    far_img = create_grid(size, far[0], far[1], 2, True).astype(np.float32)
+    near_img = create_grid(2 * size, near[0], near[1], 2, True)
+
+    tx, ty = tilt
+    c = size / 2.0
+    scale = np.array([[1.0 + depth * scale_gain * tx, 0.0], [0.0, 1.0 + depth * scale_gain * ty]])
+    a = np.radians(depth * rot_gain * (tx + ty) / 2.0)
+    rot = np.array([[np.cos(a), -np.sin(a)], [np.sin(a), np.cos(a)]])
+    A = rot @ scale
+    shift = np.array([depth * shift_gain * tx, depth * shift_gain * ty])
+    M = np.hstack([A, (np.array([c, c]) - A @ np.array([size, size]) + shift)[:, None]])
+    near_img = cv2.warpAffine(near_img, M, (size, size), flags=cv2.INTER_LINEAR, borderValue=255).astype(np.float32)
+
+    token = far_img * near_img / 255.0
+    token = np.clip(token * 0.8 + 40, 0, 255).astype(np.uint8)
+    cv2.rectangle(token, (0, 0), (size - 1, size - 1), 0, border)
+    return token
+
+def token_quad(frame_size=(config.FRAME_WIDTH, config.FRAME_HEIGHT), center=None, half=170.0, tilt=(0.0, 0.0), roll=0.0, persp=0.15):
+    w, h = frame_size
+    cx, cy = center if center is not None else (w / 2.0, h / 2.0)
+    tx, ty = tilt
+    a = np.radians(roll)
+    pts = []
+    for dx, dy in ((-1, -1), (1, -1), (1, 1), (-1, 1)):
+        x = dx * half * (1 + persp * ty * dy)
+        y = dy * half * (1 + persp * tx * dx)
+        pts.append((cx + x * np.cos(a) - y * np.sin(a), cy + x * np.sin(a) + y * np.cos(a)))
+    return np.float32(pts)
+
+def render_frame(token, quad, frame_size=(config.FRAME_WIDTH, config.FRAME_HEIGHT), blur=0.0, noise=2.0, rng=None, background=170.0):
+    rng = rng if rng is not None else np.random.default_rng()
+    w, h = frame_size
+    img = np.full((h, w), background, np.float32)
+    img += cv2.GaussianBlur(rng.normal(0.0, 20.0, (h // 4, w // 4)).astype(np.float32), (0, 0), 2)[np.arange(h) // 4][:, np.arange(w) // 4]
+    tokens, quads = (token, quad) if isinstance(token, (list, tuple)) else ([token], [quad])
+    for token, quad in zip(tokens, quads):
+        s = token.shape[0]
+        src = np.float32([[0, 0], [s - 1, 0], [s - 1, s - 1], [0, s - 1]])
+        M = cv2.getPerspectiveTransform(src, np.float32(quad))
+        fg = cv2.warpPerspective(token.astype(np.float32), M, (w, h), flags=cv2.INTER_LINEAR)
+        mask = cv2.warpPerspective(np.ones((s, s), np.float32), M, (w, h), flags=cv2.INTER_LINEAR)
+        img = img * (1 - mask) + fg * mask
+    if blur > 0:
+        img = cv2.GaussianBlur(img, (0, 0), blur)
+    if noise > 0:
+        img += rng.normal(0.0, noise, img.shape).astype(np.float32)
+    gray = np.clip(img, 0, 255).astype(np.uint8)
+    return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+
+def sequence(n=90, attack=False, depth=1.0, motion=0.3, blur=0.0, noise=2.0, seed=0,
+             frame_size=(config.FRAME_WIDTH, config.FRAME_HEIGHT)):
+    rng = np.random.default_rng(seed)
+    phase = rng.uniform(0, 2 * np.pi, 2)
+    w, h = frame_size
+    printed = render_token(depth=depth) if attack else None
+    for t in range(n):
+        tilt = (motion * np.sin(2 * np.pi * t / 45.0 + phase[0]), motion * np.sin(2 * np.pi * t / 60.0 + phase[1]))
+        token = printed if attack else render_token(tilt=tilt, depth=depth)
+        center = (w / 2.0 + 60 * tilt[0] + rng.normal(0, 0.5), h / 2.0 + 60 * tilt[1] + rng.normal(0, 0.5))
+        quad = token_quad(frame_size, center, half=min(w, h) * 0.24, tilt=tilt, roll=4.0)
+        yield render_frame(token, quad, frame_size, blur, noise, rng)
+
+def tray_sequence(n=90, rows=2, cols=2, attack=(), depth=1.0, motion=0.3, blur=0.0, noise=2.0, seed=0,
+                  frame_size=(2 * config.FRAME_WIDTH, 2 * config.FRAME_HEIGHT)):
+    rng = np.random.default_rng(seed)
+    count = rows * cols
+    phase = rng.uniform(0, 2 * np.pi, 2)
+    w, h = frame_size
+    cell_w, cell_h = w / cols, h / rows
+    printed = {i: render_token(depth=depth) for i in attack}
+    for t in range(n):
+        tilt = (motion * np.sin(2 * np.pi * t / 45.0 + phase[0]), motion * np.sin(2 * np.pi * t / 60.0 + phase[1]))
+        tokens, quads = [], []
+        for i in range(count):
+            cx = (i % cols + 0.5) * cell_w + 30 * tilt[0] + rng.normal(0, 0.5)
+            cy = (i // cols + 0.5) * cell_h + 30 * tilt[1] + rng.normal(0, 0.5)
+            tokens.append(printed[i] if i in printed else render_token(tilt=tilt, depth=depth))
+            quads.append(token_quad(frame_size, (cx, cy), half=min(cell_w, cell_h) * 0.36, tilt=tilt, roll=4.0))
+        yield render_frame(tokens, quads, frame_size, blur, noise, rng)
@@ -0,0 +1,48 @@
+import argparse
+import numpy as np
+from pbm import config, revocation
+
+def _hids(args):
+    hids = list(args.hids)
+    if args.file:
+        with open(args.file) as f:
+            hids += [line.strip() for line in f if line.strip()]
+    return hids
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--index", default=config.REVOCATION_PATH, help="revocation index to read or update")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    for name, text in (("revoke", "revoke passport ids"), ("restore", "lift a revocation"), ("check", "look up passport ids")):
+        p = sub.add_parser(name, help=text)
+        p.add_argument("hids", nargs="*")
+        p.add_argument("--file", help="read one passport id per line")
+    p_delta = sub.add_parser("delta", help="write a delta file for kiosks to sync")
+    p_delta.add_argument("out")
+    p_delta.add_argument("--revoke", nargs="*", default=[])
+    p_delta.add_argument("--restore", nargs="*", default=[])
+    p_sync = sub.add_parser("sync", help="apply delta files to the local index")
+    p_sync.add_argument("deltas", nargs="+")
+    p_compact = sub.add_parser("compact", help="merge pending deltas into the sorted index")
+    p_compact.add_argument("--seen", action="store_true", help="--index is a scan counter index")
+    args = parser.parse_args()
+    if args.cmd == "delta":
+        delta = np.concatenate([revocation.entries(args.revoke, revocation.REVOKED), revocation.entries(args.restore, revocation.RESTORED)])
+        revocation.write_delta(args.out, delta)
+        print(f"Wrote {len(delta)} changes to {args.out}")
+    else:
+        index = revocation.SeenIndex(args.index) if getattr(args, "seen", False) else revocation.RevocationList(args.index)
+        if args.cmd == "revoke":
+            index.revoke(_hids(args))
+        elif args.cmd == "restore":
+            index.restore(_hids(args))
+        elif args.cmd == "sync":
+            for path in args.deltas:
+                index.sync(path)
+        elif args.cmd == "compact":
+            index.compact()
+        else:
+            for hid in _hids(args):
+                print(f"{hid}: {'REVOKED' if hid in index else 'ok'}")
+        if args.cmd != "check" and index.pending() >= config.INDEX_COMPACT_AT:
+            index.compact()
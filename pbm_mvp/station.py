@@ -0,0 +1,312 @@
+import argparse
+import multiprocessing
+import queue
+import time
+from multiprocessing import shared_memory
+import cv2
+import numpy as np
+from pbm import config, features, publisher, registry, revocation, roi, sources
+from pbm.pbm_scale import compute_pbm_scale
+from enroll import EnrollmentSession
+from verify import VerificationSession
+
+ENROLL = "enroll"
+VERIFY = "verify"
+
+class _Forward:
+    def __init__(self, events, cam):
+        self.events = events
+        self.cam = cam
+
+    def submit(self, identity, hid):
+        self.events.put(("passport", self.cam, hid, identity))
+
+    def close(self):
+        pass
+
+class _Tap(sources.FrameSource):
+    def __init__(self, source, preview, lock):
+        self.source = source
+        self.preview = preview
+        self.lock = lock
+        self.frames = 0
+        self.ended = False
+
+    def get_frame(self):
+        frame = self.source.get_frame()
+        if frame is None:
+            self.ended = True
+            return None
+        self.frames += 1
+        if self.preview is not None:
+            small = cv2.resize(frame, (self.preview.shape[1], self.preview.shape[0]), interpolation=cv2.INTER_AREA)
+            with self.lock:
+                self.preview[:] = small
+        return frame
+
+    def release(self):
+        pass
+
+class _StationVerification(VerificationSession):
+    def __init__(self, cam, events, *args):
+        super().__init__(*args)
+        self.cam_id = cam
+        self.events = events
+
+    def _display_final_result(self, display, final_gen, scale_diff, scale_limit, diffs):
+        self.events.put(("verified", self.cam_id, self.hid, bool(final_gen), float(scale_diff)))
+
+    def _identify(self, display):
+        pbm_measured = compute_pbm_scale(self.parallax, self.areas)
+        measured, _ = features.compute_fingerprint(self.features, pbm_measured)
+        self.events.put(("identified", self.cam_id, self.registry.query(measured, 5)))
+        return False
+
+def _session(cam, mode, tap, events, opts, reg, revoked):
+    if mode == ENROLL:
+        return EnrollmentSession(tap, True, opts["workers"], opts["sequential"], _Forward(events, cam))
+    return _StationVerification(cam, events, tap, True, opts["workers"], opts["sequential"], reg, None, revoked)
+
+def _close(session):
+    if session.pipeline is not None:
+        session.pipeline.close()
+    if hasattr(session, "qr"):
+        session.qr.release()
+
+def _wait_clear(tap, stop):
+    tracker = roi.RoiTracker()
+    misses = 0
+    while not stop.is_set() and misses <= config.ROI_TRACK_MAX_MISSES:
+        frame = tap.get_frame()
+        if frame is None:
+            return
+        misses = 0 if tracker.find(frame) is not None else misses + 1
+
+def _status(session):
+    return session.state, session.decision_val, len(session.features), session.REQ
+
+def _worker(cam, spec, mode, opts, shm_name, lock, events, stop):
+    cv2.setNumThreads(1)
+    shm = shared_memory.SharedMemory(shm_name) if shm_name else None
+    preview = None if shm is None else np.ndarray(config.STATION_PREVIEW_SHAPE, np.uint8, shm.buf)
+    source = None
+    try:
+        source = sources.open_source(spec)
+        tap = _Tap(source, preview, lock)
+        reg = registry.Registry(opts["registry"]) if mode == VERIFY and opts["registry"] else None
+        revoked = revocation.RevocationList(opts["revoked"]) if opts["revoked"] else None
+        session = _session(cam, mode, tap, events, opts, reg, revoked)
+        last = None
+        rejected = None
+        t0 = time.perf_counter()
+        while not stop.is_set():
+            if session.step():
+                status = _status(session)
+                if status != last:
+                    events.put(("status", cam) + status)
+                    last = status
+                if mode == VERIFY:
+                    result = session.result if session.qr_error else None
+                    if result is not None and result != rejected:
+                        events.put(("rejected", cam, result))
+                    rejected = result
+                continue
+            if tap.ended or mode == ENROLL:
+                break
+            _close(session)
+            _wait_clear(tap, stop)
+            session = _session(cam, mode, tap, events, opts, reg, revoked)
+        _close(session)
+        elapsed = time.perf_counter() - t0
+        events.put(("done", cam, tap.frames, tap.frames / elapsed if elapsed > 0 else 0.0))
+    except Exception as e:
+        events.put(("error", cam, f"{type(e).__name__}: {e}"))
+    finally:
+        if source is not None:
+            source.release()
+        if shm is not None:
+            del preview
+            shm.close()
+
+class Station:
+    def __init__(self, specs, mode=VERIFY, workers=config.STATION_PIPELINE_WORKERS, sequential=config.DECISION_SEQUENTIAL,
+                 preview=False, publisher=None, registry=None, revoked=None, seen=None):
+        if mode not in (ENROLL, VERIFY):
+            raise ValueError(f"Unknown station mode {mode!r}")
+        self.specs = list(specs)
+        self.mode = mode
+        self.preview = preview
+        self.publisher = publisher
+        self.registry = registry
+        self.seen = seen
+        self.opts = {
+            "workers": workers, "sequential": sequential,
+            "registry": None if registry is None else registry.path,
+            "revoked": None if revoked is None else revoked.path,
+        }
+        self.status = {}
+        self.results = {}
+        self.errors = {}
+        self.fps = {}
+        self._ctx = multiprocessing.get_context("spawn")
+        self._events = self._ctx.Queue()
+        self._stop = self._ctx.Event()
+        self._shm = []
+        self._locks = []
+        self._procs = []
+
+    def start(self):
+        size = int(np.prod(config.STATION_PREVIEW_SHAPE))
+        for cam, spec in enumerate(self.specs):
+            shm = shared_memory.SharedMemory(create=True, size=size) if self.preview else None
+            lock = self._ctx.Lock()
+            self._shm.append(shm)
+            self._locks.append(lock)
+            proc = self._ctx.Process(
+                target=_worker, name=f"pbm-cam{cam}", daemon=True,
+                args=(cam, spec, self.mode, self.opts, None if shm is None else shm.name, lock, self._events, self._stop))
+            proc.start()
+            self._procs.append(proc)
+
+    def _on_passport(self, cam, hid, identity):
+        if self.registry is not None:
+            dup = self.registry.find_duplicate(identity)
+            if dup is not None:
+                print(f"[cam{cam}] REJECTED: fingerprint {hid} duplicates enrolled token {dup}")
+                self.results[cam] = f"DUPLICATE {dup}"
+                return
+            self.registry.add(identity, hid)
+        if self.publisher is not None:
+            print(f"[cam{cam}] Enrolled {hid}, QR queued to {self.publisher.submit(identity, hid)}")
+        else:
+            print(f"[cam{cam}] Enrolled {hid}")
+        self.results[cam] = f"ENROLLED {hid}"
+
+    def _on_verified(self, cam, hid, genuine, scale_diff):
+        res_txt = "GENUINE" if genuine else "MISMATCH"
+        print(f"[cam{cam}] RESULT: {res_txt} {hid} (scale diff {scale_diff:.6f})")
+        if self.seen is not None:
+            scans = self.seen.record(hid)
+            if scans > config.SEEN_MAX_SCANS:
+                print(f"[cam{cam}] FLAGGED: passport {hid} scanned {scans} times")
+                res_txt += f" REUSED x{scans}"
+        self.results[cam] = res_txt
+
+    def _on_rejected(self, cam, result):
+        res_txt = result["result"] if "id" not in result else f"{result['result']} {result['id']}"
+        print(f"[cam{cam}] REJECTED: {res_txt}")
+        self.results[cam] = res_txt
+
+    def _on_identified(self, cam, matches):
+        for hid, score in matches:
+            print(f"[cam{cam}]   {hid}: {score:.3f}")
+        self.results[cam] = f"IDENTIFIED {matches[0][0]}" if matches else "UNKNOWN"
+        print(f"[cam{cam}] RESULT: {self.results[cam]}")
+
+    def _handle(self, event):
+        kind, cam, *rest = event
+        if kind == "status":
+            self.status[cam] = rest
+        elif kind == "passport":
+            self._on_passport(cam, *rest)
+        elif kind == "verified":
+            self._on_verified(cam, *rest)
+        elif kind == "rejected":
+            self._on_rejected(cam, *rest)
+        elif kind == "identified":
+            self._on_identified(cam, *rest)
+        elif kind == "done":
+            self.fps[cam] = rest[1]
+            print(f"[cam{cam}] stopped after {rest[0]} frames ({rest[1]:.1f} fps)")
+        elif kind == "error":
+            self.errors[cam] = rest[0]
+            print(f"[cam{cam}] ERROR: {rest[0]}")
+
+    def poll(self, timeout=0.0):
+        try:
+            self._handle(self._events.get(timeout=timeout) if timeout else self._events.get_nowait())
+        except queue.Empty:
+            return False
+        while True:
+            try:
+                self._handle(self._events.get_nowait())
+            except queue.Empty:
+                return True
+
+    def alive(self):
+        return any(p.is_alive() for p in self._procs)
+
+    def composite(self):
+        h, w = config.STATION_PREVIEW_SHAPE[:2]
+        cols = min(len(self.specs), config.STATION_PREVIEW_COLS)
+        rows = -(-len(self.specs) // cols)
+        out = np.zeros((rows * h, cols * w, 3), np.uint8)
+        for cam, (shm, lock) in enumerate(zip(self._shm, self._locks)):
+            y, x = cam // cols * h, cam % cols * w
+            tile = out[y:y + h, x:x + w]
+            with lock:
+                tile[:] = np.ndarray(config.STATION_PREVIEW_SHAPE, np.uint8, shm.buf)
+            lines = [f"CAM {cam}"]
+            if cam in self.status:
+                state, decision_val, captured, req = self.status[cam]
+                lines.append(f"{state} {decision_val} {captured}/{req}")
+            if cam in self.results:
+                lines.append(self.results[cam])
+            if cam in self.errors:
+                lines.append("ERROR")
+            for i, text in enumerate(lines):
+                cv2.putText(tile, text, (8, 20 + 20 * i), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 1)
+        return out
+
+    def run(self):
+        self.start()
+        try:
+            while self.alive():
+                self.poll(0.0 if self.preview else 0.1)
+                if self.preview:
+                    cv2.imshow("Station", self.composite())
+                    if cv2.waitKey(15) & 0xFF == ord("q"):
+                        break
+        except KeyboardInterrupt:
+            pass
+        self.close()
+
+    def close(self):
+        self._stop.set()
+        deadline = time.monotonic() + config.STATION_STOP_TIMEOUT_S
+        while self.alive() and time.monotonic() < deadline:
+            self.poll(0.05)
+        for p in self._procs:
+            if p.is_alive():
+                p.terminate()
+            p.join()
+        self.poll()
+        for shm in self._shm:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+        self._shm = []
+        if self.publisher is not None:
+            self.publisher.close()
+        if self.registry is not None:
+            self.registry.close()
+        if self.preview:
+            cv2.destroyAllWindows()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("mode", choices=(ENROLL, VERIFY))
+    parser.add_argument("--source", action="append", required=True, help="camera index, video file, image directory or .npy frame stack (repeat per camera)")
+    parser.add_argument("--workers", type=int, default=config.STATION_PIPELINE_WORKERS, help="frame processing threads inside each camera process (0 = serial)")
+    parser.add_argument("--sequential", action="store_true", default=config.DECISION_SEQUENTIAL, help="stop as soon as the liveness test and fingerprint are conclusive")
+    parser.add_argument("--preview", action="store_true", help="show a composited preview of all cameras")
+    parser.add_argument("--service", metavar="DIR", help="enroll: write QR images and index.jsonl to DIR")
+    parser.add_argument("--registry", help="enroll: reject duplicates; verify: identify tokens without a QR")
+    parser.add_argument("--revoked", help="verify: reject passports listed in this revocation index")
+    parser.add_argument("--seen", help="verify: count scans per passport and flag frequent reuse")
+    args = parser.parse_args()
+    pub = publisher.PassportPublisher(args.service) if args.service else None
+    reg = registry.Registry(args.registry) if args.registry else None
+    revoked = revocation.RevocationList(args.revoked) if args.revoked else None
+    seen = revocation.SeenIndex(args.seen) if args.seen else None
+    Station(args.source, args.mode, args.workers, args.sequential, args.preview, pub, reg, revoked, seen).run()
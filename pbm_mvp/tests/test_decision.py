@@ -0,0 +1,32 @@
+import warnings
+import itertools
+import numpy as np
+from pbm import decision, layers, normalize, roi, synthetic
+
+def _shifts(frames):
+    tracker, normalizer = roi.RoiTracker(), normalize.Normalizer()
+    out = []
+    for frame in frames:
+        quad = tracker.find(frame)
+        out.append((0, 0, 0, 0, 0) if quad is None else layers.calculate_parallax_shift(normalizer.normalize(frame, quad)))
+    return np.array(out, dtype=np.float64)
+
+def test_sequential_accepts_token_held_still_before_moving():
+    shifts = _shifts(itertools.chain(synthetic.sequence(30, motion=0.0), synthetic.sequence(90)))
+    engine = decision.DecisionEngine(sequential=True)
+    verdicts = [engine.update(*s) for s in shifts]
+    assert decision.INVALID_2D not in verdicts
+    assert verdicts[-1] == decision.VALID_3D
+    assert list(decision.DecisionEngine(sequential=True).decide_many(shifts)) == verdicts
+
+def test_decide_many_is_quiet_on_padded_windows():
+    rng = np.random.default_rng(0)
+    shifts = rng.normal(0, 2, (120, 5))
+    shifts[:, 4] = 0.05
+    shifts[:10, 4] = 0
+    shifts[50:100, 4] = 0
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        for sequential in (True, False):
+            engine = decision.DecisionEngine(sequential=sequential)
+            assert len(engine.decide_many(shifts)) == len(shifts)
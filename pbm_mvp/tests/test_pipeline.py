@@ -0,0 +1,15 @@
+from pbm import pipeline, roi, synthetic
+
+FRAME_SIZE = (1280, 720)
+
+def test_fanned_out_results_keep_their_own_roi():
+    frame = next(synthetic.tray_sequence(1, seed=3, frame_size=FRAME_SIZE))
+    rois = dict(enumerate(roi.find_rois(frame)))
+    fanout = pipeline.FramePipeline(1)
+    try:
+        results = {res.seq: res for res in fanout.process_many(frame, rois)}
+    finally:
+        fanout.close()
+    serial = pipeline.FrameProcessor()
+    for key, quad in rois.items():
+        assert results[key].features() == serial.process(key, frame, quad).features()
@@ -0,0 +1,24 @@
+from pbm import config, registry
+
+def _identity(f1=0.31, f2=0.47, rel_angle=42.0, pbm_scale=0.11):
+    return {"f1": f1, "a1": 1.0, "f2": f2, "a2": 1.0, "rel_angle": rel_angle, "pbm_scale": pbm_scale}
+
+def test_scale_separates_same_grid(tmp_path):
+    reg = registry.Registry(str(tmp_path / "registry.bin"))
+    for i in range(50):
+        reg.add(_identity(pbm_scale=0.11 + 10 * config.PBM_SCALE_EPS * (i + 1)), f"{i + 1:016x}")
+    reg.add(_identity(), f"{99:016x}")
+    assert len(reg._candidates(registry.as_vector(_identity()))) == 1
+    assert reg.find_duplicate(_identity(pbm_scale=0.11 + 0.5 * config.PBM_SCALE_EPS)) == f"{99:016x}"
+    assert reg.find_duplicate(_identity(pbm_scale=0.11 + 2 * config.PBM_SCALE_EPS)) is None
+    reg.close()
+
+def test_added_records_persist_after_close(tmp_path):
+    path = str(tmp_path / "registry.bin")
+    reg = registry.Registry(path)
+    for i in range(3):
+        reg.add(_identity(f1=0.31 + i), f"{i + 1:016x}")
+    reg.close()
+    again = registry.Registry(path)
+    assert len(again) == 3
+    assert again.find_duplicate(_identity(f1=2.31)) == f"{3:016x}"
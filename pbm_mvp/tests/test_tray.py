@@ -0,0 +1,50 @@
+import itertools
+import numpy as np
+from pbm import config, sources, synthetic
+from enroll import TrayEnrollmentSession
+
+FRAME_SIZE = (1280, 720)
+
+class _Frames(sources.FrameSource):
+    def __init__(self, frames):
+        self.frames = iter(frames)
+
+    def get_frame(self):
+        return next(self.frames, None)
+
+class _Collect:
+    def __init__(self):
+        self.hids = []
+
+    def submit(self, identity, hid):
+        self.hids.append(hid)
+        return hid
+
+    def close(self):
+        pass
+
+def _run(frames):
+    session = TrayEnrollmentSession(_Frames(frames), headless=True, workers=1, sequential=True, publisher=_Collect())
+    while session.step():
+        pass
+    session.fanout.close()
+    return session
+
+def test_second_tray_in_same_slots_is_enrolled(monkeypatch):
+    monkeypatch.setattr(config, "SHOW_DEBUG", False)
+    blank = synthetic.render_frame([], [], FRAME_SIZE, rng=np.random.default_rng(0))
+    frames = itertools.chain(
+        synthetic.tray_sequence(90, seed=2, frame_size=FRAME_SIZE),
+        [blank] * 15,
+        synthetic.tray_sequence(90, seed=7, frame_size=FRAME_SIZE))
+    session = _run(frames)
+    assert session.n_enrolled == 8
+    assert sorted(session.enrolled) == list(range(8))
+    assert len(session.publisher.hids) == 8
+
+def test_briefly_hidden_tray_is_not_enrolled_twice(monkeypatch):
+    monkeypatch.setattr(config, "SHOW_DEBUG", False)
+    blank = synthetic.render_frame([], [], FRAME_SIZE, rng=np.random.default_rng(0))
+    tray = list(synthetic.tray_sequence(90, seed=2, frame_size=FRAME_SIZE))
+    session = _run(itertools.chain(tray, [blank] * (config.ROI_TRACK_MAX_MISSES + 3), tray))
+    assert session.n_enrolled == 4
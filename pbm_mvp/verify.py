@@ -1,47 +1,112 @@
+import argparse
 import cv2
-import json
 import numpy as np
 import collections
-from cryptography.hazmat.primitives import serialization
-from pbm import camera, roi, normalize, layers, decision, features, config
+from pbm import recording, revocation, passport, qr_scan, registry, camera, roi, decision, features, config, sources, pipeline, metrics
 from pbm.pbm_scale import compute_pbm_scale
+from pbm.running import RunningStats
 class VerificationSession:
-    def __init__(self):
-        self.cam = camera.Camera()
-        self.engine = decision.DecisionEngine()
-        self.qr = cv2.QRCodeDetector()
-        self.state = "SCAN"
-        self.features = []
+    def __init__(self, source=None, headless=False, workers=config.PIPELINE_WORKERS, sequential=config.DECISION_SEQUENTIAL, registry=None, recorder=None, revoked=None, seen=None):
+        self.cam = source if source is not None else camera.Camera()
+        self.headless = headless
+        self.engine = decision.DecisionEngine(sequential=sequential)
+        self.sequential = sequential
+        self.tracker = roi.RoiTracker()
+        self.processor = pipeline.FrameProcessor()
+        self.pipeline = pipeline.FramePipeline(workers) if workers > 0 else None
+        self.decision_val = decision.UNDECIDABLE
+        self.seq = 0
+        self.qr = qr_scan.QrScanner(threaded=config.QR_SCAN_THREADED and not headless)
+        self.gated = 0
+        self.payloads = collections.OrderedDict()
+        self.qr_error = None
+        self.registry = registry
+        self.recorder = recorder
+        self.revoked = revoked
+        self.seen = seen
+        self.scans = 0
+        self.state = "SCAN" if registry is None else "MEASURE"
+        self.features = features.FeatureStats()
         self.claimed = None
-        self.parallax = []
-        self.areas = []
-    def _decode_qr(self, frame):
-        if isinstance(self.qr, cv2.wechat_qrcode_WeChatQRCode):
-            res, _ = self.qr.detectAndDecode(frame)
-            return res[0] if res else ""
-        text, _, _ = self.qr.detectAndDecode(frame)
-        return text
+        self.hid = None
+        self.result = None
+        self.parallax = RunningStats()
+        self.areas = RunningStats()
+        self.REQ = 10
+    def reset(self):
+        if self.pipeline is not None:
+            for _ in self.pipeline.drain(): pass
+        self.engine.reset()
+        self.tracker.reset()
+        self.qr.reset()
+        self.decision_val = decision.UNDECIDABLE
+        self.seq = 0
+        self.gated = 0
+        self.qr_error = None
+        self.scans = 0
+        self.state = "SCAN" if self.registry is None else "MEASURE"
+        self.features = features.FeatureStats()
+        self.claimed = None
+        self.hid = None
+        self.result = None
+        self.parallax = RunningStats()
+        self.areas = RunningStats()
+    def _done(self):
+        if len(self.features) >= self.REQ: return True
+        return self.sequential and features.fingerprint_converged(self.features)
+    def _show(self, display, wait_ms=0):
+        if self.headless: return
+        with metrics.profiler.stage("render"):
+            cv2.imshow("Verify", display)
+        if wait_ms: cv2.waitKey(wait_ms)
     def _verify_qr_payload(self, text):
-        payload = json.loads(text)
-        with open("public_key.pem", "rb") as f:
-            k = serialization.load_pem_public_key(f.read())
-        s = json.dumps(payload["data"], sort_keys=True)
-        k.verify(bytes.fromhex(payload["sig"]), s.encode())
-        self.claimed = payload["data"]["fp"]
+        return passport.decode(text)
+    def _check_payload(self, text):
+        if text not in self.payloads:
+            if len(self.payloads) >= config.QR_PAYLOAD_CACHE:
+                self.payloads.popitem(last=False)
+            try:
+                self.payloads[text] = self._verify_qr_payload(text)
+            except Exception:
+                self.payloads[text] = None
+        else:
+            self.payloads.move_to_end(text)
+            metrics.profiler.count("qr_payload_cached")
+        decoded = self.payloads[text]
+        self.qr_error = "INVALID QR/SIG" if decoded is None else None
+        if decoded is None:
+            self.result = {"result": "INVALID", "error": self.qr_error}
+            return
+        hid, claimed = decoded
+        if self.revoked is not None and hid in self.revoked:
+            metrics.profiler.count("qr_revoked")
+            self.qr_error = "REVOKED"
+            self.result = {"result": "REVOKED", "id": hid}
+            return
+        if self.seen is not None:
+            self.scans = self.seen.record(hid)
+            if self.scans > config.SEEN_MAX_SCANS:
+                metrics.profiler.count("qr_reused")
+                print(f"WARNING: passport {hid} scanned {self.scans} times")
+        self.hid = hid
+        self.claimed = claimed
+        self.result = None
         self.state = "MEASURE"
     def _handle_scan_state(self, frame, display):
-        cv2.putText(display, "STEP 1: SCAN QR", (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 0), 2)
-        try:
-            text = self._decode_qr(frame)
-            if text: self._verify_qr_payload(text)
-        except Exception:
-            cv2.putText(display, "INVALID QR/SIG", (50, 90), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-        cv2.imshow("Verify", display)
+        if display is not None:
+            cv2.putText(display, "STEP 1: SCAN QR", (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 0), 2)
+        self.qr.submit(frame)
+        text = self.qr.poll()
+        if text: self._check_payload(text)
+        if self.qr_error and display is not None:
+            cv2.putText(display, self.qr_error, (50, 90), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+        self._show(display)
         return True
     def _draw_measurement_feedback(self, display, roi_cnt, decision_val):
-        cv2.polylines(display, [roi_cnt], True, (0, 255, 0), 2)
+        if display is None: return
+        cv2.polylines(display, [roi_cnt.astype(np.int32)], True, (0, 255, 0), 2)
         cv2.putText(display, f"LIVENESS: {decision_val}", (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 0), 2)
-        cv2.putText(display, f"MEASURING: {len(self.features)}/10", (50, 90), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+        cv2.putText(display, f"MEASURING: {len(self.features)}/{self.REQ}", (50, 90), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
     def _compare_features(self, measured):
         diffs = {}
         for k in ["f1", "f2", "rel_angle"]:
@@ -49,9 +114,9 @@ class VerificationSession:
             diff = abs(measured[k] - self.claimed[k])
             if k == "rel_angle":
                 if diff > 90: diff = 180 - diff
-                limit = 5.0
+                limit = config.FINGERPRINT_ANGLE_TOL
             else:
-                limit = 0.02
+                limit = config.FINGERPRINT_FREQ_TOL
             diffs[k] = (diff, diff < limit)
         return diffs
     def _display_final_result(self, display, final_gen, scale_diff, scale_limit, diffs):
@@ -59,11 +124,32 @@ class VerificationSession:
         for k, (d, ok) in diffs.items():
             print(f"  {k}: {d:.4f} {'[OK]' if ok else '[FAIL]'}")
         res_txt = "GENUINE" if final_gen else "MISMATCH"
+        print(f"RESULT: {res_txt}")
+        reused = self.scans > config.SEEN_MAX_SCANS
+        if reused: print(f"FLAGGED: passport scanned {self.scans} times")
+        if display is None: return
         color = (0, 255, 0) if final_gen else (0, 0, 255)
         cv2.putText(display, res_txt, (50, 150), cv2.FONT_HERSHEY_SIMPLEX, 2, color, 4)
-        cv2.imshow("Verify", display)
-        cv2.waitKey(3000)
+        if reused:
+            cv2.putText(display, f"REUSED x{self.scans}", (50, 200), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 165, 255), 3)
+        self._show(display, 3000)
+    def _identify(self, display):
+        pbm_measured = compute_pbm_scale(self.parallax, self.areas)
+        measured, _ = features.compute_fingerprint(self.features, pbm_measured)
+        matches = self.registry.query(measured, 5)
+        self.result = {"result": "IDENTIFIED" if matches else "UNKNOWN", "matches": matches}
+        for hid, score in matches:
+            print(f"  {hid}: {score:.3f}")
+        res_txt = f"IDENTIFIED {matches[0][0]}" if matches else "UNKNOWN"
+        print(f"RESULT: {res_txt}")
+        if display is None: return False
+        color = (0, 255, 0) if matches else (0, 0, 255)
+        cv2.putText(display, res_txt, (50, 150), cv2.FONT_HERSHEY_SIMPLEX, 1.2, color, 3)
+        self._show(display, 3000)
+        return False
     def _finalize_verification(self, display):
+        if self.claimed is None:
+            return self._identify(display)
         pbm_measured = compute_pbm_scale(self.parallax, self.areas)
         scale_diff = abs(pbm_measured - self.claimed["pbm_scale"])
         measured, _ = features.compute_fingerprint(self.features, pbm_measured)
@@ -72,40 +158,94 @@ class VerificationSession:
         scale_limit = config.PBM_SCALE_EPS
         scale_ok = scale_diff < scale_limit
         final_gen = scale_ok and feat_ok
+        self.result = {
+            "result": "GENUINE" if final_gen else "MISMATCH", "id": self.hid, "scale_diff": float(scale_diff),
+            "features": {k: [float(d), bool(ok)] for k, (d, ok) in diffs.items()}, "scans": self.scans,
+        }
         self._display_final_result(display, final_gen, scale_diff, scale_limit, diffs)
         return False
+    def _apply(self, res):
+        if self.recorder is not None:
+            self.recorder.add(res)
+        if res.roi is None:
+            if self.engine.decided == decision.INVALID_2D: self.engine.reset()
+            self.decision_val = self.engine.update(0, 0, 0, 0, 0)
+            return
+        if res.gated:
+            self.gated += 1
+            return
+        dnx, dny, dfx, dfy, conf = res.parallax
+        self.decision_val = self.engine.update(dnx, dny, dfx, dfy, conf, res.coherence)
+        diff_mag = ((dnx - dfx)**2 + (dny - dfy)**2)**0.5
+        self.parallax.add(diff_mag)
+        self.areas.add(res.area)
+        if self.decision_val == "VALID_3D":
+            feat = res.features()
+            if feat: self.features.add(feat)
+    def _measure(self, frame, roi_cnt, flush=False):
+        if self.pipeline is None:
+            self._apply(self.processor.process(self.seq, frame, roi_cnt))
+        else:
+            if frame is not None:
+                self.pipeline.submit(frame, roi_cnt)
+            for res in (self.pipeline.drain() if flush else self.pipeline.ready()):
+                if self._done(): break
+                self._apply(res)
+        self.seq += 1
     def _handle_measure_state(self, frame, display):
-        roi_cnt = roi.find_roi(frame)
+        with metrics.profiler.stage("roi"):
+            roi_cnt = self.tracker.find(frame)
+        self._measure(frame, roi_cnt)
         if roi_cnt is None:
-            self.engine.update(0, 0, 0, 0, 0)
-            cv2.putText(display, "ALIGN PRODUCT", (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 255), 2)
-            cv2.imshow("Verify", display)
-            return True
-        norm = normalize.normalize_roi(frame, roi_cnt)
-        dnx, dny, dfx, dfy, conf = layers.calculate_parallax_shift(norm)
-        decision_val = self.engine.update(dnx, dny, dfx, dfy, conf)
-        diff_mag = ((dnx - dfx)**2 + (dny - dfy)**2)**0.5
-        self.parallax.append(diff_mag)
-        self.areas.append(cv2.contourArea(roi_cnt))
-        self._draw_measurement_feedback(display, roi_cnt, decision_val)
-        if decision_val == "VALID_3D":
-            feat = features.extract_features(norm)
-            if feat: self.features.append(feat)
-        if len(self.features) >= 10:
+            if display is not None:
+                cv2.putText(display, "ALIGN PRODUCT", (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 255), 2)
+        else:
+            self._draw_measurement_feedback(display, roi_cnt, self.decision_val)
+        if self._done():
             return self._finalize_verification(display)
-        cv2.imshow("Verify", display)
+        self._show(display)
         return True
     def step(self):
         frame = self.cam.get_frame()
-        if frame is None: return False
-        display = frame.copy()
+        if frame is None:
+            if self.state == "MEASURE" and self.pipeline is not None:
+                self._measure(None, None, flush=True)
+                if self._done(): self._finalize_verification(None)
+            return False
+        metrics.profiler.tick()
+        metrics.profiler.gauge("camera_dropped", getattr(self.cam, "dropped", 0))
+        display = None if self.headless else frame.copy()
         if self.state == "SCAN":
             return self._handle_scan_state(frame, display)
         return self._handle_measure_state(frame, display)
     def run(self):
         while self.step():
-            if cv2.waitKey(1) & 0xFF == ord("q"): break
+            if not self.headless and cv2.waitKey(1) & 0xFF == ord("q"): break
+        if self.pipeline is not None: self.pipeline.close()
+        self.qr.release()
         self.cam.release()
-        cv2.destroyAllWindows()
+        if self.recorder is not None:
+            self.recorder.close()
+        metrics.profiler.export()
+        if not self.headless: cv2.destroyAllWindows()
 if __name__ == "__main__":
-    VerificationSession().run()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--source", help="camera index, video file, image directory or .npy frame stack")
+    parser.add_argument("--headless", action="store_true", help="run without a display window")
+    parser.add_argument("--workers", type=int, default=config.PIPELINE_WORKERS, help="frame processing threads (0 = serial)")
+    parser.add_argument("--sequential", action="store_true", default=config.DECISION_SEQUENTIAL, help="stop as soon as the liveness test and fingerprint are conclusive")
+    parser.add_argument("--registry", help="identify the token against this fingerprint registry instead of scanning a QR")
+    parser.add_argument("--revoked", help="reject passports listed in this revocation index")
+    parser.add_argument("--seen", help="count scans per passport in this index and flag frequent reuse")
+    parser.add_argument("--record", metavar="DIR", help="append per-frame parallax, ROI area and features to a columnar recording")
+    parser.add_argument("--label", choices=("live", "attack"), help="ground truth stored with --record")
+    parser.add_argument("--token", help="token identifier stored with --record")
+    parser.add_argument("--metrics", help="export stage timings to a .jsonl or Prometheus .prom file")
+    args = parser.parse_args()
+    if args.metrics: metrics.enable(args.metrics)
+    src = sources.open_source(args.source) if args.source is not None else None
+    reg = registry.Registry(args.registry) if args.registry else None
+    rec = recording.SessionRecorder(args.record, args.label, args.token) if args.record else None
+    revoked = revocation.RevocationList(args.revoked) if args.revoked else None
+    seen = revocation.SeenIndex(args.seen) if args.seen else None
+    VerificationSession(src, args.headless, args.workers, args.sequential, reg, rec, revoked, seen).run()